@@ -34,6 +34,14 @@ def make_app(root, static_root=None, logging={}, debug=False,
         existing_hooks.append(RequestViewerHook(conf.requestviewer))
         kw['hooks'] = existing_hooks
 
+    # Template renderer settings can also come from the app configuration
+    for key in (
+        'template_auto_reload', 'template_cache_size', 'template_cache_dir',
+        'preload_templates'
+    ):
+        if key not in kw and hasattr(conf.app, key):
+            kw[key] = getattr(conf.app, key)
+
     # Instantiate the WSGI app by passing **kw onward
     app = Pecan(root, **kw)
 
@@ -0,0 +1,297 @@
+import cPickle as pickle
+import math
+import os
+import socket
+from binascii import crc32
+from hashlib import md5
+from tempfile import mkstemp
+from threading import Lock
+from time import time
+
+from util import LRUCache
+
+__all__ = ['MemoryBackend', 'FileBackend', 'MemcachedBackend']
+
+
+def _hash_key(key):
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return md5(key).hexdigest()
+
+
+class MemoryBackend(object):
+    '''
+    A cache backend which stores values in process memory, evicting the
+    least recently used values when it's full.  Values are not copied, so
+    they shouldn't be modified after being cached.
+
+    :param maxsize: The maximum number of values to keep.
+    '''
+
+    def __init__(self, maxsize=1024):
+        self._cache = LRUCache(maxsize)
+
+    def get(self, key, default=None):
+        '''
+        Returns the value cached for ``key``, or ``default``.
+        '''
+        return self._cache.get(key, default)
+
+    def set(self, key, value, ttl=None):
+        '''
+        Caches ``value`` for ``key``.
+
+        :param ttl: The lifetime of the value, in seconds, or ``None`` to
+                    cache it until it's evicted.
+        '''
+        self._cache.set(key, value, ttl)
+
+    def delete(self, key):
+        '''
+        Removes the value cached for ``key``, if any.
+        '''
+        self._cache.delete(key)
+
+    def clear(self):
+        '''
+        Removes every cached value.
+        '''
+        self._cache.clear()
+
+
+class FileBackend(object):
+    '''
+    A cache backend which stores pickled values as files in a directory,
+    so that they're shared by every process (e.g., every worker of a
+    multi-process server) which uses the same directory.  Expired files are
+    removed when they're next read.  Values which can't be read or written
+    (e.g., because the disk is full) are treated as cache misses.
+
+    :param path: The directory to store cached values in.  It's created if
+                 it doesn't exist.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+
+    def _filename(self, key):
+        return os.path.join(self.path, _hash_key(key))
+
+    def get(self, key, default=None):
+        '''
+        Returns the value cached for ``key``, or ``default``.
+        '''
+        filename = self._filename(key)
+        try:
+            with open(filename, 'rb') as f:
+                expires, value = pickle.load(f)
+        except (IOError, OSError, EOFError, ValueError,
+                pickle.UnpicklingError):
+            return default
+        if expires is not None and expires <= time():
+            self.delete(key)
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        '''
+        Caches ``value`` for ``key``.
+
+        :param ttl: The lifetime of the value, in seconds, or ``None`` to
+                    cache it until it's deleted.
+        '''
+        expires = time() + ttl if ttl is not None else None
+        filename = self._filename(key)
+        # write to a temporary file first, so that other processes never
+        # read a partially written value
+        try:
+            fd, tmp = mkstemp(dir=self.path, prefix='.')
+        except (IOError, OSError):
+            return
+        stored = False
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+            try:
+                os.rename(tmp, filename)
+            except OSError:
+                # on Windows, files can't be renamed over existing ones
+                self._remove(filename)
+                os.rename(tmp, filename)
+            stored = True
+        except (IOError, OSError):
+            pass
+        finally:
+            if not stored:
+                self._remove(tmp)
+
+    def _remove(self, filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+    def delete(self, key):
+        '''
+        Removes the value cached for ``key``, if any.
+        '''
+        self._remove(self._filename(key))
+
+    def clear(self):
+        '''
+        Removes every cached value.
+        '''
+        for filename in os.listdir(self.path):
+            if not filename.startswith('.'):
+                self._remove(os.path.join(self.path, filename))
+
+
+class _MemcachedServer(object):
+
+    def __init__(self, address, timeout):
+        host, _, port = address.rpartition(':')
+        self.address = (host or address, int(port or 11211))
+        self.timeout = timeout
+        self.lock = Lock()
+        self.sock = self.file = None
+
+    def connect(self):
+        if self.sock is None:
+            self.sock = socket.create_connection(self.address, self.timeout)
+            self.file = self.sock.makefile('rb')
+
+    def close(self):
+        if self.sock is not None:
+            self.file.close()
+            self.sock.close()
+            self.sock = self.file = None
+
+    def command(self, line, data=None):
+        '''
+        Sends a command (and its data, if any), returning the first line of
+        the response.
+        '''
+        self.connect()
+        if data is not None:
+            line = '%s\r\n%s' % (line, data)
+        self.sock.sendall(line + '\r\n')
+        return self.readline()
+
+    def readline(self):
+        line = self.file.readline()
+        if not line.endswith('\r\n'):
+            raise socket.error('connection closed by the memcached server')
+        return line[:-2]
+
+    def read(self, n):
+        data = self.file.read(n + 2)
+        if len(data) != n + 2:
+            raise socket.error('connection closed by the memcached server')
+        return data[:-2]
+
+
+class MemcachedBackend(object):
+    '''
+    A cache backend which stores pickled values in one or more ``memcached``
+    servers, using the ``memcached`` text protocol.  Keys are spread across
+    the servers by their hash.
+
+    Caching is an optimization, so if a server can't be reached, values
+    are treated as missing (and aren't stored) rather than raising an error;
+    the connection is retried on the next use.
+
+    :param servers: A list of ``host:port`` server addresses.
+    :param timeout: The timeout for connecting to (and communicating with)
+                    the servers, in seconds.
+    :param prefix: A prefix for every key, so that several applications
+                   can share the same servers.
+    '''
+
+    # memcached treats expiration times over 30 days as Unix timestamps
+    _max_relative_ttl = 60 * 60 * 24 * 30
+
+    def __init__(self, servers=['127.0.0.1:11211'], timeout=1.0, prefix=''):
+        if isinstance(servers, basestring):
+            servers = [servers]
+        self.servers = [_MemcachedServer(s, timeout) for s in servers]
+        self.prefix = prefix
+
+    def _key(self, key):
+        # hashing keeps them within memcached's length and character limits
+        key = self.prefix + _hash_key(key)
+        server = self.servers[(crc32(key) & 0xffffffff) % len(self.servers)]
+        return server, key
+
+    def _call(self, server, func, *args):
+        with server.lock:
+            try:
+                return func(server, *args)
+            except socket.error:
+                server.close()
+
+    def get(self, key, default=None):
+        '''
+        Returns the value cached for ``key``, or ``default``.
+        '''
+        server, key = self._key(key)
+        value = self._call(server, self._get, key)
+        return default if value is None else value[0]
+
+    def _get(self, server, key):
+        line = server.command('get %s' % key)
+        data = None
+        while line != 'END':
+            parts = line.split()
+            if len(parts) != 4 or parts[0] != 'VALUE':
+                raise socket.error('unexpected response: %r' % line)
+            data = server.read(int(parts[3]))
+            line = server.readline()
+        if data is not None:
+            return (pickle.loads(data),)
+
+    def set(self, key, value, ttl=None):
+        '''
+        Caches ``value`` for ``key``.
+
+        :param ttl: The lifetime of the value, in seconds, or ``None`` to
+                    cache it until it's evicted.
+        '''
+        server, key = self._key(key)
+        if ttl is None:
+            exptime = 0
+        else:
+            # memcached doesn't support fractional (or zero) lifetimes
+            exptime = max(int(math.ceil(ttl)), 1)
+            if exptime > self._max_relative_ttl:
+                exptime += int(time())
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self._call(
+            server,
+            lambda server: server.command(
+                'set %s 0 %d %d' % (key, exptime, len(data)),
+                data
+            )
+        )
+
+    def delete(self, key):
+        '''
+        Removes the value cached for ``key``, if any.
+        '''
+        server, key = self._key(key)
+        self._call(
+            server,
+            lambda server: server.command('delete %s' % key)
+        )
+
+    def clear(self):
+        '''
+        Removes every value from every server (including those stored by
+        other applications).
+        '''
+        for server in self.servers:
+            self._call(server, lambda server: server.command('flush_all'))
@@ -2,3 +2,4 @@ from base import CommandRunner, BaseCommand
 from serve import ServeCommand
 from shell import ShellCommand
 from create import CreateCommand
+from warm import WarmCommand
@@ -0,0 +1,76 @@
+"""
+Warm command for Pecan.
+"""
+import os
+import sys
+
+from pecan.commands import BaseCommand
+
+
+class WarmCommand(BaseCommand):
+    """
+    Compiles every template of a Pecan web application.
+
+    This command loads the application and every template in its template
+    path with the application's renderer, reporting how long each took to
+    compile and any that failed.  When ``template_cache_dir`` is configured,
+    the compiled templates are stored there, so the application's processes
+    don't have to compile them on first use (e.g., after a deploy).
+    """
+
+    arguments = BaseCommand.arguments + ({
+        'name': '--renderer',
+        'help': 'the renderer to compile templates with (defaults to the '
+                'application\'s default renderer)'
+    },)
+
+    def run(self, args):
+        super(WarmCommand, self).run(args)
+        app = self.find_pecan(self.load_app())
+        renderers = app.renderers
+
+        name = args.renderer or app.default_renderer
+        template_path = app.template_path
+
+        if not renderers.template_options['cache_dir']:
+            print ('Warning: `template_cache_dir` is not configured, so '
+                   'compiled templates will not be reused.')
+
+        total, failed = 0, 0
+        for template, seconds, error in renderers.load_templates(
+            name,
+            template_path
+        ):
+            total += 1
+            if error is None:
+                print '%8.1fms  %s' % (seconds * 1000, template)
+            else:
+                failed += 1
+                print '  FAILED  %s: %s' % (template, error)
+
+        print 'Compiled %d of %d templates with %s in %s' % (
+            total - failed, total, name, template_path
+        )
+        if failed:
+            sys.exit(1)
+
+    def load_app(self):
+        from pecan import load_app
+        if not os.path.isfile(self.args.config_file):
+            raise RuntimeError('`%s` is not a file.' % self.args.config_file)
+        # the templates are loaded below, so don't preload them
+        return load_app(self.args.config_file, preload_templates=False)
+
+    def find_pecan(self, app):
+        """
+        Returns the ``Pecan`` application wrapped by (Pecan's) middleware.
+        """
+        from pecan import Pecan
+        while not isinstance(app, Pecan):
+            wrapped = getattr(app, 'app', getattr(app, 'application', None))
+            if wrapped is None:
+                raise RuntimeError(
+                    'Unable to find the Pecan application within `%r`.' % app
+                )
+            app = wrapped
+        return app
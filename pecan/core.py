@@ -1,11 +1,17 @@
-from templating import RendererFactory
-from routing import lookup_controller, NonCanonicalPath
-from util import _cfg, encode_if_needed
+from cache import MemoryBackend
+from templating import RendererFactory, _builtin_content_types
+from msgpackify import CONTENT_TYPE as MSGPACK_CONTENT_TYPE
+from hooks import HookChain
+from routing import (
+    resolve_controller, NonCanonicalPath, RouteTree, RouteCache
+)
+from secure import handle_security
+from util import _cfg, compile_binder, get_binder, LRUCache, SingleFlight
 from middleware.recursive import ForwardRequestException
 
 from webob import Request, Response, exc
+from hashlib import md5
 from threading import local
-from itertools import chain
 from mimetypes import guess_type, add_type
 from urlparse import urlsplit, urlunsplit
 from os.path import splitext
@@ -15,28 +21,59 @@ try:
 except ImportError:             # pragma: no cover
     from json import loads      # noqa
 
-import urllib
 import sys
 
-# make sure that json is defined in mimetypes
+# make sure that json, msgpack and ndjson are defined in mimetypes
 add_type('application/json', '.json', True)
+add_type(MSGPACK_CONTENT_TYPE, '.msgpack', True)
+add_type('application/x-ndjson', '.ndjson', True)
+
+# the media types a client can list in its Accept header to ask for a
+# msgpack response
+MSGPACK_ACCEPT_TYPES = (
+    MSGPACK_CONTENT_TYPE,
+    'application/msgpack',
+    'application/vnd.msgpack'
+)
 
 state = local()
 
 
+def set_context_local(factory):
+    '''
+    Replaces the storage used for per-request state (what ``pecan.request``,
+    ``pecan.response`` and hooks' ``state`` refer to), which is a
+    ``threading.local`` by default.  Use this to keep request state separate
+    per greenlet when serving with a greenlet-based server that doesn't
+    monkey-patch ``threading``, e.g.::
+
+        from gevent.local import local
+        pecan.core.set_context_local(local)
+
+    This should be called at startup, before any requests are handled.
+
+    :param factory: A callable returning a new local storage object, such
+                    as ``gevent.local.local`` or ``eventlet.corolocal.local``.
+    '''
+    global state
+    state = factory()
+
+
 def proxy(key):
     class ObjectProxy(object):
-        def __getattr__(self, attr):
-            obj = getattr(state, key)
-            return getattr(obj, attr)
+        # ``__getattribute__`` (rather than ``__getattr__``) is used so that
+        # attribute access never has to fail a normal lookup on the proxy
+        # itself before being forwarded
+        __slots__ = ()
+
+        def __getattribute__(self, attr):
+            return getattr(getattr(state, key), attr)
 
         def __setattr__(self, attr, value):
-            obj = getattr(state, key)
-            return setattr(obj, attr, value)
+            return setattr(getattr(state, key), attr, value)
 
         def __delattr__(self, attr):
-            obj = getattr(state, key)
-            return delattr(obj, attr)
+            return delattr(getattr(state, key), attr)
     return ObjectProxy()
 
 
@@ -132,18 +169,24 @@ def render(template, namespace):
     return state.app.render(template, namespace)
 
 
-def load_app(config):
+def load_app(config, preload_templates=None):
     '''
     Used to load a ``Pecan`` application and its environment based on passed
     configuration.
 
     :param config: Can be a dictionary containing configuration, or a string
                    which represents a (relative) configuration filename.
+    :param preload_templates: If specified, overrides the app configuration's
+                              ``preload_templates`` setting, i.e., whether
+                              every template should be loaded before the
+                              first request.
 
     returns a pecan.Pecan object
     '''
     from configuration import _runtime_conf, set_config
     set_config(config, overwrite=True)
+    if preload_templates is not None:
+        _runtime_conf.app['preload_templates'] = preload_templates
 
     for package_name in getattr(_runtime_conf.app, 'modules', []):
         module = __import__(package_name, fromlist=['app'])
@@ -156,6 +199,109 @@ def load_app(config):
     )
 
 
+def _is_iterator(obj):
+    return hasattr(obj, 'next') and hasattr(obj, '__iter__')
+
+
+def _encode_chunks(chunks, charset):
+    '''
+    Returns an iterator over each chunk of a streamed response body,
+    encoding ``unicode`` chunks with ``charset``.
+
+    The chunks are usually produced after Pecan has finished handling the
+    request, so the current request's state (e.g., ``pecan.request``) is
+    restored while they are, for the benefit of generators and streamed
+    templates.  If they're produced while the request is still being
+    handled (e.g., by an ``after`` hook which reads the body), its state is
+    left alone.
+    '''
+    context = dict(state.__dict__)
+
+    def encode():
+        current = state.__dict__
+        previous = None
+        if current.get('request') is not context.get('request'):
+            previous = dict(current)
+            current.update(context)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, unicode):
+                    chunk = chunk.encode(charset)
+                yield chunk
+        finally:
+            if previous is not None:
+                for key in context:
+                    if key not in previous:
+                        current.pop(key, None)
+                current.update(previous)
+            if hasattr(chunks, 'close'):
+                chunks.close()
+    return encode()
+
+
+def _version_etag(version, content_type):
+    '''
+    Returns the ``ETag`` for the representation (with ``content_type``) of
+    a resource whose version (returned by an ``etag`` function passed to
+    ``@expose``) is ``version``.
+    '''
+    if isinstance(version, unicode):
+        version = version.encode('utf-8')
+    return md5('%s\0%s' % (content_type, version)).hexdigest()
+
+
+def _response_cache_key(req, cache):
+    '''
+    Returns the key which the response to ``req`` is cached by, for a
+    controller flagged with ``@cached`` (whose options are ``cache``).
+    '''
+    if cache['vary'] is None:
+        params = sorted(req.GET.items())
+    else:
+        params = [(name, req.params.getall(name)) for name in cache['vary']]
+    headers = [req.headers.get(name) for name in cache['vary_headers']]
+    return 'response:%r' % ((
+        req.pecan['routing_path'],
+        req.pecan['content_type'],
+        params,
+        headers
+    ),)
+
+
+def _snapshot_response(headerlist):
+    '''
+    Returns the current response's status, body and the headers which were
+    set since ``headerlist`` was copied from it (i.e., by the controller and
+    its template, rather than by hooks), as stored by the response cache.
+    '''
+    previous = list(headerlist)
+    headers = []
+    for header in response.headerlist:
+        if header in previous:
+            previous.remove(header)
+        else:
+            headers.append(header)
+    return (response.status, headers, response.body)
+
+
+def _restore_response(snapshot):
+    '''
+    Restores the current response from a snapshot of a cached (or shared)
+    response, replacing any headers of the same names (but keeping those
+    which hooks have set for this request).
+    '''
+    status, headerlist, body = snapshot
+    response.status = status
+    headers = response.headers
+    for name in set(name for name, value in headerlist):
+        if name in headers:
+            del headers[name]
+    for name, value in headerlist:
+        headers.add(name, value)
+    response.body = body
+    response.conditional_response = 'ETag' in response.headers
+
+
 class Pecan(object):
     '''
     Base Pecan application object. Generally created using ``pecan.make_app``,
@@ -176,6 +322,51 @@ class Pecan(object):
                                 namespace automatically.
     :param force_canonical: A boolean indicating if this project should
                             require canonical URLs.
+    :param compile_routes: A boolean indicating if a static route tree should
+                           be compiled from the root controller when the
+                           application is created, so that static paths can
+                           be resolved without walking the controller objects
+                           on every request.
+    :param route_cache_size: The number of resolved routes to keep in an LRU
+                             cache, keyed on routing path, request method
+                             and extension.  Defaults to 0 (disabled).
+    :param notfound_cache_size: The number of unroutable paths to remember,
+                                so that repeated requests for them are
+                                answered with a 404 without walking the
+                                controllers.  Only paths which were not found
+                                without consulting ``_lookup``, ``_default``
+                                or ``_route`` are remembered.  Defaults to 0
+                                (disabled).
+    :param notfound_cache_ttl: The number of seconds to remember unroutable
+                               paths for.
+    :param template_auto_reload: A boolean indicating if the builtin template
+                                 renderers should check templates for
+                                 changes when rendering them.  Disable this
+                                 in production.
+    :param template_cache_size: The number of compiled templates the builtin
+                                template renderers should keep in memory.
+                                Defaults to each template engine's default.
+    :param template_cache_dir: A directory in which to store compiled
+                               templates (for Mako and Jinja2), so that they
+                               can be shared between processes and reused
+                               after restarts.
+    :param preload_templates: A boolean indicating if every template in
+                              ``template_path`` should be loaded (with the
+                              default renderer) when the application is
+                              created, rather than on first use.
+    :param response_cache: The backend (from :mod:`pecan.cache`) in which to
+                           store the responses of controllers flagged with
+                           ``@cached``.  Defaults to a
+                           :class:`~pecan.cache.MemoryBackend`.
+    :param generate_etags: A boolean indicating if an ``ETag`` should be
+                           generated (by hashing the body) for every
+                           rendered response to a ``GET`` or ``HEAD``
+                           request, so that clients which already have the
+                           response receive a ``304 Not Modified``.
+    :param coalesce_timeout: The number of seconds requests coalesced by
+                             ``@cached(coalesce=True)`` wait for the first
+                             request's response before calling the
+                             controller themselves.
     '''
 
     def __init__(self, root,
@@ -184,7 +375,18 @@ class Pecan(object):
                  hooks=[],
                  custom_renderers={},
                  extra_template_vars={},
-                 force_canonical=True
+                 force_canonical=True,
+                 compile_routes=False,
+                 route_cache_size=0,
+                 notfound_cache_size=0,
+                 notfound_cache_ttl=60,
+                 template_auto_reload=True,
+                 template_cache_size=None,
+                 template_cache_dir=None,
+                 preload_templates=False,
+                 response_cache=None,
+                 generate_etags=False,
+                 coalesce_timeout=30
         ):
         '''
         '''
@@ -193,11 +395,36 @@ class Pecan(object):
             root = self.__translate_root__(root)
 
         self.root = root
-        self.renderers = RendererFactory(custom_renderers, extra_template_vars)
+        self.renderers = RendererFactory(
+            custom_renderers,
+            extra_template_vars,
+            auto_reload=template_auto_reload,
+            cache_size=template_cache_size,
+            cache_dir=template_cache_dir
+        )
         self.default_renderer = default_renderer
         self.hooks = hooks
+        self.hook_chains = {}
         self.template_path = template_path
         self.force_canonical = force_canonical
+        self.route_tree = RouteTree(root) if compile_routes else None
+        self.route_cache = None
+        if route_cache_size:
+            self.route_cache = RouteCache(route_cache_size)
+        self.notfound_cache = None
+        if notfound_cache_size:
+            self.notfound_cache = LRUCache(
+                notfound_cache_size,
+                ttl=notfound_cache_ttl
+            )
+        if response_cache is None:
+            response_cache = MemoryBackend()
+        self.response_cache = response_cache
+        self.generate_etags = generate_etags
+        self.flights = SingleFlight()
+        self.coalesce_timeout = coalesce_timeout
+        if preload_templates:
+            self.load_templates()
 
     def __translate_root__(self, item):
         '''
@@ -222,6 +449,43 @@ class Pecan(object):
 
         raise ImportError('No item named %s' % item)
 
+    def load_templates(self):
+        '''
+        Loads (and compiles) every template in the template path with the
+        default renderer, so that no request has to wait for templates to be
+        compiled.  Templates which fail to load are reported with a
+        ``RuntimeWarning``.
+        '''
+
+        failed = [
+            '%s (%s)' % (template, error)
+            for template, seconds, error in self.renderers.load_templates(
+                self.default_renderer,
+                self.template_path
+            )
+            if error is not None
+        ]
+        if failed:
+            import warnings
+            warnings.warn(
+                'Failed to load templates: %s' % ', '.join(failed),
+                RuntimeWarning
+            )
+
+    def reset_routing(self):
+        '''
+        Recompiles the route tree (if any) and clears the route and not found
+        caches.  Call this after modifying controllers at runtime, e.g., when
+        reloading them.
+        '''
+
+        if self.route_tree is not None:
+            self.route_tree = RouteTree(self.root)
+        if self.route_cache is not None:
+            self.route_cache.clear()
+        if self.notfound_cache is not None:
+            self.notfound_cache.clear()
+
     def route(self, node, path):
         '''
         Looks up a controller from a node based upon the specified path.
@@ -230,10 +494,32 @@ class Pecan(object):
         :param path: The path to look up on this node.
         '''
 
-        path = path.split('/')[1:]
+        cache = notfound = trace = None
+        if node is self.root:
+            cache, notfound = self.route_cache, self.notfound_cache
+
+        if notfound is not None:
+            if notfound.get(path):
+                raise exc.HTTPNotFound
+            trace = set()
+
+        if cache is not None:
+            key = (path, request.method, request.pecan.get('extension'))
+            cached = cache.get(key)
+            if cached is not None:
+                controller, remainder, routing_args = cached
+                handle_security(controller)
+                if routing_args:
+                    request.pecan['routing_args'] = list(routing_args)
+                return controller, list(remainder)
+            trace = set()
+
+        segments = path.split('/')[1:]
         try:
-            node, remainder = lookup_controller(node, path)
-            return node, remainder
+            if self.route_tree is not None and node is self.root:
+                result = self.route_tree.lookup(segments, trace)
+            else:
+                result = resolve_controller(node, segments, trace)
         except NonCanonicalPath, e:
             if self.force_canonical and \
                 not _cfg(e.controller).get('accept_noncanonical', False):
@@ -249,23 +535,43 @@ class Pecan(object):
                 redirect(code=302, add_slash=True)
             return e.controller, e.remainder
 
+        # misses are only turned into an exception here, at the edge
+        if result is None:
+            if notfound is not None and not trace:
+                notfound.set(path, True)
+            raise exc.HTTPNotFound
+        node, remainder = result
+
+        if cache is not None:
+            cache.store(
+                key, node, remainder, trace,
+                request.pecan.get('routing_args')
+            )
+        return node, remainder
+
     def determine_hooks(self, controller=None):
         '''
         Determines the hooks to be run, in which order.
 
+        Sorted hook chains are built once (for the application, and for each
+        distinct list of controller hooks) and reused for later requests.
+
         :param controller: If specified, includes hooks for a specific
                            controller.
         '''
 
-        controller_hooks = []
+        controller_hooks = ()
         if controller:
-            controller_hooks = _cfg(controller).get('hooks', [])
-        return list(
-            sorted(
-                chain(controller_hooks, self.hooks),
-                lambda x, y: cmp(x.priority, y.priority)
+            controller_hooks = _cfg(controller).get('hooks') or ()
+        key = id(controller_hooks) if controller_hooks else None
+
+        hooks = self.hook_chains.get(key)
+        if hooks is None or not hooks.is_current(controller_hooks, self.hooks):
+            hooks = self.hook_chains[key] = HookChain(
+                controller_hooks,
+                self.hooks
             )
-        )
+        return hooks
 
     def handle_hooks(self, hook_type, *args):
         '''
@@ -276,6 +582,12 @@ class Pecan(object):
         :param \*args: Arguments to pass to the hooks.
         '''
 
+        phases = getattr(state.hooks, 'phases', None)
+        if phases is not None:
+            for hook in phases[hook_type]:
+                hook(*args)
+            return
+
         if hook_type in ['before', 'on_route']:
             hooks = state.hooks
         else:
@@ -288,72 +600,44 @@ class Pecan(object):
         '''
         Determines the arguments for a controller based upon parameters
         passed the argument specification for the controller.
+
+        ``all_params`` may also be a callable which returns the parameters
+        (which is how Pecan passes them), so that the request body is only
+        parsed if the controller can accept parameters.
         '''
-        args = []
-        kwargs = dict()
-        valid_args = argspec[0][1:]
-
-        def _decode(x):
-            return urllib.unquote_plus(x) if isinstance(x, basestring) else x
-
-        remainder = [_decode(x) for x in remainder]
-
-        if im_self is not None:
-            args.append(im_self)
-
-        # grab the routing args from nested REST controllers
-        if 'routing_args' in request.pecan:
-            remainder = request.pecan['routing_args'] + list(remainder)
-            del request.pecan['routing_args']
-
-        # handle positional arguments
-        if valid_args and remainder:
-            args.extend(remainder[:len(valid_args)])
-            remainder = remainder[len(valid_args):]
-            valid_args = valid_args[len(args):]
-
-        # handle wildcard arguments
-        if remainder:
-            if not argspec[1]:
-                abort(404)
-            args.extend(remainder)
-
-        # get the default positional arguments
-        if argspec[3]:
-            defaults = dict(zip(argspec[0][-len(argspec[3]):], argspec[3]))
+        # use the binder compiled for the current controller, if possible
+        cfg = getattr(getattr(state, 'controller', None), '_pecan', {})
+        if cfg.get('argspec') is argspec:
+            binder = get_binder(cfg)
         else:
-            defaults = dict()
-
-        # handle positional GET/POST params
-        for name in valid_args:
-            if name in all_params:
-                args.append(all_params.pop(name))
-            elif name in defaults:
-                args.append(defaults[name])
-            else:
-                break
+            binder = compile_binder(argspec)
 
-        # handle wildcard GET/POST params
-        if argspec[2]:
-            for name, value in all_params.iteritems():
-                if name not in argspec[0]:
-                    kwargs[encode_if_needed(name)] = value
+        params = all_params
+        if not callable(all_params):
+            params = lambda: all_params
 
-        return args, kwargs
+        return binder(
+            params,
+            remainder,
+            im_self,
+            request.pecan.pop('routing_args', None)
+        )
 
-    def render(self, template, namespace):
+    def render(self, template, namespace, stream=False):
         renderer = self.renderers.get(
             self.default_renderer,
             self.template_path
         )
-        if template == 'json':
-            renderer = self.renderers.get('json', self.template_path)
+        if template in _builtin_content_types:
+            renderer = self.renderers.get(template, self.template_path)
         if ':' in template:
             renderer = self.renderers.get(
                 template.split(':')[0],
                 self.template_path
             )
             template = template.split(':')[1]
+        if stream and hasattr(renderer, 'stream'):
+            return renderer.stream(template, namespace)
         return renderer.render(template, namespace)
 
     def handle_request(self):
@@ -361,24 +645,28 @@ class Pecan(object):
         The main request handler for Pecan applications.
         '''
 
+        # bind the current request once, rather than going through the
+        # ``pecan.request`` proxy for every access
+        req = state.request
+
         # get a sorted list of hooks, by priority (no controller hooks yet)
         state.hooks = self.determine_hooks()
 
         # store the routing path to allow hooks to modify it
-        request.pecan['routing_path'] = request.path
+        req.pecan['routing_path'] = req.path
 
         # handle "on_route" hooks
         self.handle_hooks('on_route', state)
 
         # lookup the controller, respecting content-type as requested
         # by the file extension on the URI
-        path = request.pecan['routing_path']
+        path = req.pecan['routing_path']
 
-        if not request.pecan['content_type'] and '.' in path.split('/')[-1]:
+        if not req.pecan['content_type'] and '.' in path.split('/')[-1]:
             path, extension = splitext(path)
-            request.pecan['extension'] = extension
+            req.pecan['extension'] = extension
             # preface with a letter to ensure compat for 2.5
-            request.pecan['content_type'] = guess_type('x' + extension)[0]
+            req.pecan['content_type'] = guess_type('x' + extension)[0]
 
         controller, remainder = self.route(self.root, path)
         cfg = _cfg(controller)
@@ -391,20 +679,33 @@ class Pecan(object):
         if cfg.get('generic'):
             im_self = controller.im_self
             handlers = cfg['generic_handlers']
-            controller = handlers.get(request.method, handlers['DEFAULT'])
+            controller = handlers.get(req.method, handlers['DEFAULT'])
             cfg = _cfg(controller)
 
         # add the controller to the state so that hooks can use it
         state.controller = controller
 
-        # if unsure ask the controller for the default content type
-        if not request.pecan['content_type']:
-            request.pecan['content_type'] = cfg.get(
+        # if unsure ask the controller for the default content type; binary
+        # formats are only used for clients which explicitly ask for them
+        if not req.pecan['content_type']:
+            if MSGPACK_CONTENT_TYPE in cfg.get('content_types', {}):
+                response.vary = tuple(response.vary or ()) + ('Accept',)
+                explicit = [
+                    offer for offer in req.accept
+                    if offer in MSGPACK_ACCEPT_TYPES
+                ]
+                # ...and only if they prefer it to the default content type
+                if explicit and req.accept.best_match(
+                    [cfg.get('content_type', 'text/html')] + explicit
+                ) in MSGPACK_ACCEPT_TYPES:
+                    req.pecan['content_type'] = MSGPACK_CONTENT_TYPE
+        if not req.pecan['content_type']:
+            req.pecan['content_type'] = cfg.get(
                 'content_type',
                 'text/html'
             )
         elif cfg.get('content_type') is not None and \
-            request.pecan['content_type'] not in cfg.get('content_types', {}):
+            req.pecan['content_type'] not in cfg.get('content_types', {}):
 
             import warnings
             msg = "Controller '%s' defined does not support content_type " + \
@@ -412,7 +713,7 @@ class Pecan(object):
             warnings.warn(
                 msg % (
                     controller.__name__,
-                    request.pecan['content_type'],
+                    req.pecan['content_type'],
                     cfg.get('content_types', {}).keys()
                 ),
                 RuntimeWarning
@@ -425,17 +726,65 @@ class Pecan(object):
         # handle "before" hooks
         self.handle_hooks('before', state)
 
-        # fetch any parameters
-        params = dict(request.params)
-
-        # fetch the arguments for the controller
+        # serve responses of @cached controllers from the cache, skipping
+        # the controller and rendering
+        cache_key = None
+        if cfg.get('cache') and req.method in ('GET', 'HEAD'):
+            cache = cfg['cache']
+            cache_backend = cache['backend'] or self.response_cache
+            cache_key = _response_cache_key(req, cache)
+            cached = cache_backend.get(cache_key)
+            if cached is not None:
+                _restore_response(cached)
+                return
+
+        # fetch the arguments for the controller; request parameters are
+        # only parsed if the controller can accept them
         args, kwargs = self.get_args(
-            params,
+            lambda: req.params,
             remainder,
             cfg['argspec'],
             im_self
         )
 
+        # when the controller provides a version function, answer clients
+        # whose version is current without calling the controller
+        etag = None
+        if req.method in ('GET', 'HEAD'):
+            etag = cfg.get('etag', self.generate_etags)
+        if callable(etag):
+            etag = _version_etag(
+                etag(*args, **kwargs),
+                req.pecan['content_type']
+            )
+            if etag in req.if_none_match:
+                response.status = 304
+                response.etag = etag
+                del response.content_type
+                return
+
+        # when coalescing, only the first of concurrent requests for the same
+        # uncached response calls the controller; the others wait for it to
+        # finish and share its response (or, if it can't be cached or takes
+        # too long, call the controller themselves)
+        if cache_key is not None and cache['coalesce']:
+            flight, leader = self.flights.join(cache_key)
+            if leader:
+                req.pecan['flight'] = flight
+            else:
+                timeout = cache['coalesce']
+                if timeout is True:
+                    timeout = self.coalesce_timeout
+                shared = self.flights.wait(flight, timeout)
+                if shared is not None:
+                    _restore_response(shared)
+                    return
+
+        # remember the headers set so far (e.g., by hooks), which aren't
+        # part of a cached response
+        if cache_key is not None:
+            headerlist = list(response.headerlist)
+
         # get the result from the controller
         result = controller(*args, **kwargs)
 
@@ -448,42 +797,71 @@ class Pecan(object):
 
         # pull the template out based upon content type and handle overrides
         template = cfg.get('content_types', {}).get(
-            request.pecan['content_type']
+            req.pecan['content_type']
         )
+        stream = cfg.get('stream', {}).get(req.pecan['content_type'])
 
         # check if for controller override of template
-        template = request.pecan.get('override_template', template)
-        request.pecan['content_type'] = request.pecan.get(
+        template = req.pecan.get('override_template', template)
+        req.pecan['content_type'] = req.pecan.get(
             'override_content_type',
-            request.pecan['content_type']
+            req.pecan['content_type']
         )
 
         # if there is a template, render it
         if template:
-            if template == 'json':
-                request.pecan['content_type'] = 'application/json'
-            result = self.render(template, result)
+            if template in _builtin_content_types:
+                req.pecan['content_type'] = _builtin_content_types[template]
+            result = self.render(template, result, stream)
 
-        if 'pecan.params' in request.environ:
-            params = request.environ.pop('pecan.params')
+        if 'pecan.params' in req.environ:
+            req.environ.pop('pecan.params')
 
         # If we are in a test request put the namespace where it can be
         # accessed directly
-        if request.environ.get('paste.testing'):
-            testing_variables = request.environ['paste.testing_variables']
+        if req.environ.get('paste.testing'):
+            testing_variables = req.environ['paste.testing_variables']
             testing_variables['namespace'] = raw_namespace
             testing_variables['template_name'] = template
             testing_variables['controller_output'] = result
 
-        # set the body content
+        # set the body content; iterators (e.g., generators) are passed
+        # through to the WSGI server as-is rather than being buffered
         if isinstance(result, unicode):
             response.unicode_body = result
+        elif _is_iterator(result):
+            response.app_iter = _encode_chunks(
+                result,
+                response.charset or 'utf-8'
+            )
         else:
             response.body = result
 
         # set the content type
-        if request.pecan['content_type']:
-            response.content_type = request.pecan['content_type']
+        if req.pecan['content_type']:
+            response.content_type = req.pecan['content_type']
+
+        # set the ETag (unless the controller did), so that webob answers
+        # clients whose version is current with a 304
+        if etag and response.status_int == 200:
+            if etag is not True:
+                response.etag = etag
+            elif 'ETag' not in response.headers and not _is_iterator(result):
+                response.md5_etag()
+            response.conditional_response = 'ETag' in response.headers
+
+        # store successful responses of @cached controllers
+        if cache_key is not None:
+            if cache['vary_headers']:
+                response.vary = tuple(response.vary or ()) + \
+                    cache['vary_headers']
+            if response.status_int == 200 and \
+                    'Set-Cookie' not in response.headers and \
+                    not _is_iterator(result):
+                snapshot = _snapshot_response(headerlist)
+                cache_backend.set(cache_key, snapshot, cache['ttl'])
+                if 'flight' in req.pecan:
+                    self.flights.land(req.pecan.pop('flight'), snapshot)
 
     def __call__(self, environ, start_response):
         '''
@@ -517,6 +895,11 @@ class Pecan(object):
             if not isinstance(e, exc.HTTPException):
                 raise
         finally:
+            # release requests waiting on a response which couldn't be shared
+            flight = state.request.pecan.pop('flight', None)
+            if flight is not None:
+                self.flights.land(flight)
+
             # handle "after" hooks
             self.handle_hooks('after', state)
 
@@ -1,9 +1,10 @@
 from inspect import getargspec, getmembers, isclass, ismethod
-from util import _cfg
+from templating import _builtin_content_types
+from util import _cfg, compile_binder
 
 __all__ = [
     'expose', 'transactional', 'accept_noncanonical', 'after_commit',
-    'after_rollback'
+    'after_rollback', 'cacheable_route', 'cached'
 ]
 
 
@@ -20,7 +21,9 @@ def when_for(controller):
 
 def expose(template=None,
            content_type='text/html',
-           generic=False):
+           generic=False,
+           stream=None,
+           etag=None):
 
     '''
     Decorator used to flag controller methods as being "exposed" for
@@ -33,10 +36,27 @@ def expose(template=None,
                     which uses generic functions based upon ``simplegeneric``
                     generic functions.  Allows you to split a single
                     controller into multiple paths based upon HTTP method.
+    :param stream: A boolean which flags that the template should be
+                   rendered incrementally and streamed to the client (if the
+                   template's renderer supports streaming), rather than
+                   being rendered into memory in its entirety first.
+                   Defaults to ``True`` for the ``ndjson`` and ``csv``
+                   templates, and ``False`` otherwise.
+    :param etag: Flags that an ``ETag`` header should be set for ``GET`` and
+                 ``HEAD`` requests, so that clients which already have the
+                 response receive a ``304 Not Modified`` instead.  ``True``
+                 hashes the response body; alternatively, a function which
+                 is passed the controller's arguments and returns a version
+                 (e.g., a last modification time) is called before the
+                 controller, which (along with its template) is skipped if
+                 the client's version is current.  ``False`` disables the
+                 application's ``generate_etags`` option for this controller.
     '''
 
-    if template == 'json':
-        content_type = 'application/json'
+    if template in _builtin_content_types:
+        content_type = _builtin_content_types[template]
+    if stream is None:
+        stream = template in ('ndjson', 'csv')
 
     def decorate(f):
         # flag the method as exposed
@@ -47,6 +67,9 @@ def expose(template=None,
         cfg['content_type'] = content_type
         cfg.setdefault('template', []).append(template)
         cfg.setdefault('content_types', {})[content_type] = template
+        cfg.setdefault('stream', {})[content_type] = stream
+        if etag is not None:
+            cfg['etag'] = etag
 
         # handle generic controllers
         if generic:
@@ -54,8 +77,10 @@ def expose(template=None,
             cfg['generic_handlers'] = dict(DEFAULT=f)
             f.when = when_for(f)
 
-        # store the arguments for this controller method
+        # store the arguments for this controller method, along with a
+        # binder compiled from them
         cfg['argspec'] = getargspec(f)
+        cfg['binder'] = compile_binder(cfg['argspec'])
 
         return f
 
@@ -139,3 +164,58 @@ def accept_noncanonical(func):
 
     _cfg(func)['accept_noncanonical'] = True
     return func
+
+
+def cacheable_route(func):
+    '''
+    Flags a controller method as safe to store in the route cache, even when
+    it is routed to through a ``_lookup`` or ``_route`` method (i.e., its
+    route only depends upon the request path and method).
+    '''
+
+    _cfg(func)['cacheable_route'] = True
+    return func
+
+
+def cached(ttl=300, vary=None, vary_headers=(), backend=None,
+           coalesce=False):
+    '''
+    Caches the responses of an exposed controller method, so that it isn't
+    called (and its template isn't rendered) again until they expire.  Only
+    successful responses to ``GET`` and ``HEAD`` requests which don't set
+    cookies are cached, and streamed responses are never cached.
+
+    Responses are cached separately for each routing path and content type,
+    so only use this for controllers whose output depends upon nothing else
+    about the request (such as the current user), or list what it does
+    depend upon in ``vary`` and ``vary_headers``.  "before" hooks are run
+    for every request, cached or not.
+
+    :param ttl: The number of seconds to cache responses for.
+    :param vary: A list of the request parameters which the response
+                 depends upon.  Defaults to every query string parameter.
+    :param vary_headers: A list of the request headers which the response
+                         depends upon (e.g., ``Accept-Language``).  They are
+                         also added to the response's ``Vary`` header.
+    :param backend: The backend (from :mod:`pecan.cache`) to store responses
+                    in.  Defaults to the application's ``response_cache``.
+    :param coalesce: A boolean indicating if concurrent requests for the
+                     same response should be coalesced when it isn't cached
+                     (e.g., when a popular response expires): the first
+                     request calls the controller, while the others wait
+                     for it and share its response.  The others wait for up
+                     to the application's ``coalesce_timeout`` before
+                     calling the controller themselves; pass a number of
+                     seconds instead of ``True`` to override it.
+    '''
+
+    def deco(f):
+        _cfg(f)['cache'] = dict(
+            ttl=ttl,
+            vary=vary,
+            vary_headers=tuple(vary_headers),
+            backend=backend,
+            coalesce=coalesce
+        )
+        return f
+    return deco
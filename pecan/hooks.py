@@ -1,5 +1,6 @@
 import sys
 from inspect   import getmembers
+from itertools import chain
 from webob.exc import HTTPFound
 
 from util      import iscontroller, _cfg
@@ -7,7 +8,7 @@ from routing   import lookup_controller
 
 __all__ = [
     'PecanHook', 'TransactionHook', 'HookController',
-    'RequestViewerHook'
+    'RequestViewerHook', 'HookChain'
 ]
 
 
@@ -89,6 +90,56 @@ class PecanHook(object):
         return
 
 
+class HookChain(list):
+    '''
+    A list of hooks, sorted by priority, which also precomputes the bound
+    hook methods to call for each hook type (``on_route`` and ``before`` in
+    priority order, ``after`` and ``on_error`` in reverse).  Hooks which
+    don't override a ``PecanHook`` method are left out of that method's
+    phase entirely.
+
+    :param controller_hooks: The hooks specific to a controller.
+    :param app_hooks: The application-wide hooks.
+    '''
+
+    types = ('on_route', 'before', 'after', 'on_error')
+
+    def __init__(self, controller_hooks=(), app_hooks=()):
+        list.__init__(self, sorted(
+            chain(controller_hooks, app_hooks),
+            key=lambda hook: hook.priority
+        ))
+        self._sources = (
+            controller_hooks, len(controller_hooks),
+            app_hooks, len(app_hooks)
+        )
+        self._priorities = [hook.priority for hook in self]
+
+        self.phases = {}
+        for hook_type in self.types:
+            hooks = self if hook_type in ('on_route', 'before') \
+                else reversed(self)
+            noop = getattr(PecanHook, hook_type).im_func
+            self.phases[hook_type] = [
+                getattr(hook, hook_type) for hook in hooks
+                if getattr(getattr(hook, hook_type), 'im_func', None)
+                is not noop
+            ]
+
+    def is_current(self, controller_hooks, app_hooks):
+        '''
+        Returns ``True`` if this chain was built from ``controller_hooks``
+        and ``app_hooks`` and they haven't changed since (including any
+        changes to the priorities of their hooks).
+        '''
+        sources = self._sources
+        return sources[0] is controller_hooks and \
+            sources[1] == len(controller_hooks) and \
+            sources[2] is app_hooks and \
+            sources[3] == len(app_hooks) and \
+            self._priorities == [hook.priority for hook in self]
+
+
 class TransactionHook(PecanHook):
     '''
     :param start: A callable that will bind to a writable database and
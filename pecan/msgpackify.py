@@ -0,0 +1,311 @@
+from struct import Struct
+
+from jsonify import _instance as _json, numpy
+
+__all__ = ['encode', 'encode_parts', 'decode', 'CONTENT_TYPE']
+
+CONTENT_TYPE = 'application/x-msgpack'
+
+_int8 = Struct('>Bb')
+_int16 = Struct('>Bh')
+_int32 = Struct('>Bi')
+_int64 = Struct('>Bq')
+_uint8 = Struct('>BB')
+_uint16 = Struct('>BH')
+_uint32 = Struct('>BI')
+_uint64 = Struct('>BQ')
+_float64 = Struct('>Bd')
+
+
+#
+# encoding
+#
+
+def encode(obj):
+    '''
+    Encodes ``obj`` as `MessagePack <http://msgpack.org>`_, returning a
+    ``str``.  Objects which ``MessagePack`` doesn't natively support are
+    converted using the same rules as :mod:`pecan.jsonify` (including
+    ``__json__`` methods and rules registered with ``jsonify.when_type``).
+
+    NumPy arrays of numbers are encoded as a map of their ``type`` (the
+    array's ``dtype.str``), ``shape`` and raw ``data``, in the same layout
+    as the ``msgpack-numpy`` package.  The map's keys are encoded as binary
+    data, which the keys of other maps never are, so that arrays can't be
+    confused with dictionaries which happen to have the same keys.
+    '''
+    return ''.join(encode_parts(obj))
+
+
+def encode_parts(obj):
+    '''
+    Encodes ``obj`` as ``MessagePack``, returning a list of strings which,
+    when joined, make up the encoded object.  The raw data of NumPy arrays
+    is included as a single string, so that it needn't be copied again.
+    '''
+    parts = []
+    _pack(obj, parts.append)
+    return parts
+
+
+def _pack_nil(obj, write):
+    write('\xc0')
+
+
+def _pack_bool(obj, write):
+    write(obj and '\xc3' or '\xc2')
+
+
+def _pack_int(obj, write):
+    if obj >= 0:
+        if obj < 0x80:
+            write(chr(obj))
+        elif obj <= 0xff:
+            write(_uint8.pack(0xcc, obj))
+        elif obj <= 0xffff:
+            write(_uint16.pack(0xcd, obj))
+        elif obj <= 0xffffffff:
+            write(_uint32.pack(0xce, obj))
+        elif obj <= 0xffffffffffffffff:
+            write(_uint64.pack(0xcf, obj))
+        else:
+            raise OverflowError('%r is too large to encode' % obj)
+    else:
+        if obj >= -32:
+            write(chr(obj & 0xff))
+        elif obj >= -0x80:
+            write(_int8.pack(0xd0, obj))
+        elif obj >= -0x8000:
+            write(_int16.pack(0xd1, obj))
+        elif obj >= -0x80000000:
+            write(_int32.pack(0xd2, obj))
+        elif obj >= -0x8000000000000000:
+            write(_int64.pack(0xd3, obj))
+        else:
+            raise OverflowError('%r is too small to encode' % obj)
+
+
+def _pack_float(obj, write):
+    write(_float64.pack(0xcb, obj))
+
+
+def _pack_header(n, fix, fixmax, type16, write):
+    if n < fixmax:
+        write(chr(fix | n))
+    elif n <= 0xffff:
+        write(_uint16.pack(type16, n))
+    else:
+        write(_uint32.pack(type16 + 1, n))
+
+
+def _pack_str(obj, write):
+    n = len(obj)
+    if n < 32:
+        write(chr(0xa0 | n))
+    elif n <= 0xff:
+        write(_uint8.pack(0xd9, n))
+    else:
+        _pack_header(n, 0, 0, 0xda, write)
+    write(obj)
+
+
+def _pack_unicode(obj, write):
+    _pack_str(obj.encode('utf-8'), write)
+
+
+def _pack_bin(obj, write):
+    n = len(obj)
+    if n <= 0xff:
+        write(_uint8.pack(0xc4, n))
+    else:
+        _pack_header(n, 0, 0, 0xc5, write)
+    if not isinstance(obj, str):
+        obj = str(obj)
+    write(obj)
+
+
+def _pack_list(obj, write):
+    _pack_header(len(obj), 0x90, 16, 0xdc, write)
+    for item in obj:
+        _pack(item, write)
+
+
+def _pack_dict(obj, write):
+    _pack_header(len(obj), 0x80, 16, 0xde, write)
+    for key, value in obj.iteritems():
+        _pack(key, write)
+        _pack(value, write)
+
+
+def _pack_ndarray(obj, write):
+    if obj.dtype.names:
+        # structured arrays are packed as a map of their columns
+        _pack_header(len(obj.dtype.names), 0x80, 16, 0xde, write)
+        for name in obj.dtype.names:
+            _pack(name, write)
+            _pack_ndarray(obj[name], write)
+    elif obj.dtype.hasobject:
+        _pack_list(obj.tolist(), write)
+    else:
+        data = numpy.ascontiguousarray(obj).tostring()
+        write('\x85')
+        _pack_bin('nd', write)
+        _pack_bool(True, write)
+        _pack_bin('type', write)
+        _pack_str(obj.dtype.str, write)
+        _pack_bin('kind', write)
+        _pack_bin('', write)
+        _pack_bin('shape', write)
+        _pack_list(obj.shape, write)
+        _pack_bin('data', write)
+        _pack_bin(data, write)
+
+
+# packers, by exact type
+_packers = {
+    type(None): _pack_nil,
+    bool: _pack_bool,
+    int: _pack_int,
+    long: _pack_int,
+    float: _pack_float,
+    str: _pack_str,
+    unicode: _pack_unicode,
+    bytearray: _pack_bin,
+    list: _pack_list,
+    tuple: _pack_list,
+    dict: _pack_dict,
+}
+
+# packers for subclasses of supported types, in order of precedence
+_base_packers = (
+    (bool, _pack_bool),
+    ((int, long), _pack_int),
+    (float, _pack_float),
+    (str, _pack_str),
+    (unicode, _pack_unicode),
+    (bytearray, _pack_bin),
+    ((list, tuple), _pack_list),
+    (dict, _pack_dict),
+)
+
+if numpy is not None:
+    _packers[numpy.ndarray] = _pack_ndarray
+    _base_packers += ((numpy.ndarray, _pack_ndarray),)
+
+
+def _pack(obj, write):
+    packer = _packers.get(obj.__class__)
+    if packer is None:
+        for types, packer in _base_packers:
+            if isinstance(obj, types):
+                break
+        else:
+            # convert anything else as jsonify would
+            return _pack(_json.default(obj), write)
+    packer(obj, write)
+
+
+#
+# decoding
+#
+
+def decode(data):
+    '''
+    Decodes the ``MessagePack``-encoded string ``data``.  Strings are
+    returned as ``unicode`` and binary data as ``str``; if NumPy is
+    installed, encoded arrays are returned as (read-only) arrays.
+    '''
+    obj, offset = _unpack(data, 0)
+    if offset != len(data):
+        raise ValueError('extra data after the encoded object')
+    return obj
+
+
+def _unpack(data, offset):
+    code = ord(data[offset])
+    offset += 1
+    if code < 0x80:
+        return code, offset
+    elif code >= 0xe0:
+        return code - 0x100, offset
+    elif code & 0xf0 == 0x90:
+        return _unpack_list(code & 0x0f, data, offset)
+    elif code & 0xf0 == 0x80:
+        return _unpack_dict(code & 0x0f, data, offset)
+    elif code & 0xe0 == 0xa0:
+        n = code & 0x1f
+        return data[offset:offset + n].decode('utf-8'), offset + n
+    elif code == 0xc0:
+        return None, offset
+    elif code == 0xc2:
+        return False, offset
+    elif code == 0xc3:
+        return True, offset
+    elif code in _fixed:
+        fmt = _fixed[code]
+        return fmt.unpack_from(data, offset)[0], offset + fmt.size
+    elif code in _sized:
+        fmt, kind = _sized[code]
+        n = fmt.unpack_from(data, offset)[0]
+        offset += fmt.size
+        if kind == 'list':
+            return _unpack_list(n, data, offset)
+        elif kind == 'dict':
+            return _unpack_dict(n, data, offset)
+        value = data[offset:offset + n]
+        if kind == 'str':
+            value = value.decode('utf-8')
+        return value, offset + n
+    raise ValueError('unsupported MessagePack type 0x%02x' % code)
+
+
+def _unpack_list(n, data, offset):
+    items = []
+    for i in xrange(n):
+        item, offset = _unpack(data, offset)
+        items.append(item)
+    return items, offset
+
+
+def _unpack_dict(n, data, offset):
+    items = {}
+    ndarray = False
+    for i in xrange(n):
+        key, offset = _unpack(data, offset)
+        items[key], offset = _unpack(data, offset)
+        # encoded arrays are marked with a binary (i.e., ``str``) key, which
+        # the keys of encoded dictionaries never are
+        if key.__class__ is str and key == 'nd':
+            ndarray = items[key] is True
+    if numpy is not None and ndarray and 'data' in items:
+        # NumPy arrays are read directly from the encoded data
+        array = numpy.frombuffer(items['data'], numpy.dtype(items['type']))
+        return array.reshape(items['shape']), offset
+    return items, offset
+
+
+_fixed = {
+    0xca: Struct('>f'),
+    0xcb: Struct('>d'),
+    0xcc: Struct('>B'),
+    0xcd: Struct('>H'),
+    0xce: Struct('>I'),
+    0xcf: Struct('>Q'),
+    0xd0: Struct('>b'),
+    0xd1: Struct('>h'),
+    0xd2: Struct('>i'),
+    0xd3: Struct('>q'),
+}
+
+_sized = {
+    0xc4: (Struct('>B'), 'bin'),
+    0xc5: (Struct('>H'), 'bin'),
+    0xc6: (Struct('>I'), 'bin'),
+    0xd9: (Struct('>B'), 'str'),
+    0xda: (Struct('>H'), 'str'),
+    0xdb: (Struct('>I'), 'str'),
+    0xdc: (Struct('>H'), 'list'),
+    0xdd: (Struct('>I'), 'list'),
+    0xde: (Struct('>H'), 'dict'),
+    0xdf: (Struct('>I'), 'dict'),
+}
@@ -1,9 +1,13 @@
+from inspect import isclass, isfunction, ismodule
 from webob import exc
 
-from secure import handle_security, cross_boundary
-from util import iscontroller
+from secure import handle_security, cross_boundary, _SecuredAttribute
+from util import iscontroller, LRUCache, _cfg
 
-__all__ = ['lookup_controller', 'find_object']
+__all__ = [
+    'lookup_controller', 'resolve_controller', 'find_object', 'RouteTree',
+    'RouteCache'
+]
 
 
 class NonCanonicalPath(Exception):
@@ -17,65 +21,101 @@ class NonCanonicalPath(Exception):
         self.remainder = remainder
 
 
-def lookup_controller(obj, url_path):
+def lookup_controller(obj, url_path, trace=None):
     '''
     Traverses the requested url path and returns the appropriate controller
     object, including default routes.
 
     Handles common errors gracefully.
+
+    :param trace: An optional set, which is updated with the names of the
+                  dynamic routing features (``_default``, ``_lookup``,
+                  ``_route`` and ``secured``) that were consulted while
+                  traversing.
+    '''
+    result = resolve_controller(obj, url_path, trace)
+    if result is None:
+        raise exc.HTTPNotFound
+    return result
+
+
+def resolve_controller(obj, url_path, trace=None):
+    '''
+    Like ``lookup_controller``, but returns ``None`` (rather than raising
+    ``HTTPNotFound``) when no controller can be found, so that misses and
+    ``_default``/``_lookup`` fallbacks don't pay for building and unwinding
+    an exception.
     '''
     remainder = url_path
     notfound_handlers = []
 
     while True:
         try:
-            obj, remainder = find_object(obj, remainder, notfound_handlers)
+            result = _find_object(obj, remainder, notfound_handlers, trace)
+        except exc.HTTPNotFound:
+            # raised by a custom ``_route`` method
+            result = None
+
+        if result is not None:
+            obj, remainder = result
             handle_security(obj)
             return obj, remainder
-        except exc.HTTPNotFound:
-            while notfound_handlers:
-                name, obj, remainder = notfound_handlers.pop()
-                if name == '_default':
-                    # Notfound handler is, in fact, a controller, so stop
-                    #   traversal
-                    return obj, remainder
-                else:
-                    # Notfound handler is an internal redirect, so continue
-                    #   traversal
-                    try:
-                        result = obj(*remainder)
-                        if result:
-                            prev_obj = obj
-                            obj, remainder = result
-                            # crossing controller boundary
-                            cross_boundary(prev_obj, obj)
-                            break
-                    except TypeError, te:
-                        import warnings
-                        msg = 'Got exception calling lookup(): %s (%s)'
-                        warnings.warn(
-                            msg % (te, te.args),
-                            RuntimeWarning
-                        )
+
+        while notfound_handlers:
+            name, obj, remainder = notfound_handlers.pop()
+            if trace is not None:
+                trace.add(name)
+            if name == '_default':
+                # Notfound handler is, in fact, a controller, so stop
+                #   traversal
+                return obj, remainder
             else:
-                raise exc.HTTPNotFound
+                # Notfound handler is an internal redirect, so continue
+                #   traversal
+                try:
+                    result = obj(*remainder)
+                    if result:
+                        prev_obj = obj
+                        obj, remainder = result
+                        # crossing controller boundary
+                        cross_boundary(prev_obj, obj)
+                        break
+                except TypeError, te:
+                    import warnings
+                    msg = 'Got exception calling lookup(): %s (%s)'
+                    warnings.warn(
+                        msg % (te, te.args),
+                        RuntimeWarning
+                    )
+        else:
+            return None
 
 
-def find_object(obj, remainder, notfound_handlers):
+def find_object(obj, remainder, notfound_handlers, trace=None):
     '''
     'Walks' the url path in search of an action for which a controller is
     implemented and returns that controller object along with what's left
     of the remainder.
     '''
+    result = _find_object(obj, remainder, notfound_handlers, trace)
+    if result is None:
+        raise exc.HTTPNotFound
+    return result
+
+
+def _find_object(obj, remainder, notfound_handlers, trace):
     prev_obj = None
     while True:
         if obj is None:
-            raise exc.HTTPNotFound
+            return None
         if iscontroller(obj):
             return obj, remainder
 
         # are we traversing to another controller
         cross_boundary(prev_obj, obj)
+        if trace is not None and (
+                hasattr(obj, '_pecan') or isinstance(obj, _SecuredAttribute)):
+            trace.add('secured')
 
         if remainder and remainder[0] == '':
             index = getattr(obj, 'index', None)
@@ -96,12 +136,206 @@ def find_object(obj, remainder, notfound_handlers):
 
         route = getattr(obj, '_route', None)
         if iscontroller(route):
+            if trace is not None:
+                trace.add('_route')
             next, next_remainder = route(remainder)
             cross_boundary(route, next)
             return next, next_remainder
 
         if not remainder:
-            raise exc.HTTPNotFound
+            return None
         next, remainder = remainder[0], remainder[1:]
         prev_obj = obj
         obj = getattr(obj, next, None)
+
+
+class _RouteNode(object):
+    '''
+    A precompiled view of a single (non-controller) object in the controller
+    tree, as built by ``RouteTree``.
+    '''
+    __slots__ = ('obj', 'index', 'controllers', 'children', 'dynamic')
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.index = None
+        self.controllers = {}
+        self.children = {}
+        self.dynamic = False
+
+
+class RouteTree(object):
+    '''
+    A static route trie, compiled once from a root controller object.
+
+    Each node records the exposed controllers and sub-controllers reachable
+    through plain attributes, so that static paths are resolved with
+    dictionary lookups rather than ``getattr`` probes for ``index``,
+    ``_default``, ``_lookup`` and ``_route`` on every segment.
+
+    Nodes which define ``_default``, ``_lookup`` or ``_route`` (or which
+    participate in security, e.g., ``SecureController``) are marked as
+    dynamic, and any path segment the tree doesn't know about falls back to
+    ``resolve_controller`` from the closest known node, so routing results
+    are identical to a full object walk.
+
+    :param root: The root controller object.
+    '''
+
+    def __init__(self, root):
+        self.root = self._compile(root, set(), {})
+
+    def _compile(self, obj, path, nodes):
+        # objects which are reachable through several paths are compiled
+        # once, and share their node
+        if id(obj) in nodes:
+            return nodes[id(obj)]
+
+        node = _RouteNode(obj)
+        if self._is_dynamic(obj) or id(obj) in path:
+            node.dynamic = True
+            return node
+
+        index = getattr(obj, 'index', None)
+        if iscontroller(index):
+            node.index = index
+
+        path.add(id(obj))
+        for name, value in self._static_members(obj):
+            if iscontroller(value):
+                node.controllers[name] = value
+            elif self._is_container(value):
+                child = self._compile(value, path, nodes)
+                if child.dynamic or child.index or child.controllers or \
+                        child.children:
+                    node.children[name] = child
+        path.discard(id(obj))
+        nodes[id(obj)] = node
+        return node
+
+    def _is_dynamic(self, obj):
+        if hasattr(obj, '_pecan'):
+            return True
+        for name in ('_default', '_lookup', '_route'):
+            if iscontroller(getattr(obj, name, None)):
+                return True
+        return False
+
+    def _is_container(self, value):
+        if isclass(value) or ismodule(value):
+            return False
+        if getattr(type(value), '__module__', None) == '__builtin__':
+            return False
+        # secured objects need their parent to be tracked while walking,
+        # so they are always resolved by ``lookup_controller``
+        if isinstance(value, _SecuredAttribute) or hasattr(value, '_pecan'):
+            return False
+        # only descend into objects which look like controllers, rather
+        # than every attribute value (e.g., loggers or database engines)
+        if self._is_dynamic(value):
+            return True
+        for name, member in self._static_members(value):
+            if iscontroller(member):
+                return True
+        return False
+
+    def _static_members(self, obj):
+        '''
+        Yields the public attributes of ``obj`` which can be safely resolved
+        ahead of time (i.e., skipping properties and other descriptors, which
+        may return a different object on every access).
+        '''
+        if not hasattr(type(obj), '__mro__'):
+            return
+
+        namespaces = [getattr(obj, '__dict__', {})]
+        namespaces.extend(vars(cls) for cls in type(obj).__mro__)
+
+        seen = set()
+        for namespace in namespaces:
+            for name, raw in namespace.items():
+                if name.startswith('_') or name in seen:
+                    continue
+                seen.add(name)
+                if isfunction(raw) or isinstance(
+                        raw, (staticmethod, classmethod)):
+                    yield name, getattr(obj, name)
+                elif not hasattr(raw, '__get__'):
+                    yield name, raw
+
+    def lookup(self, url_path, trace=None):
+        '''
+        Resolves ``url_path`` (a list of path segments) to a controller and
+        remainder, with the same semantics as ``resolve_controller`` (i.e.,
+        returns ``None`` if no controller can be found).
+
+        :param url_path: The path to look up, split into segments.
+        :param trace: An optional set of consulted dynamic routing features,
+                      as for ``lookup_controller``.
+        '''
+        node = self.root
+        remainder = url_path
+        while True:
+            if node.dynamic:
+                return resolve_controller(node.obj, remainder, trace)
+
+            if remainder and remainder[0] == '':
+                if node.index is not None:
+                    handle_security(node.index)
+                    return node.index, remainder[1:]
+            elif not remainder:
+                if node.index is not None:
+                    raise NonCanonicalPath(node.index, remainder[1:])
+                return None
+
+            controller = node.controllers.get(remainder[0])
+            if controller is not None:
+                handle_security(controller)
+                return controller, remainder[1:]
+
+            child = node.children.get(remainder[0])
+            if child is None:
+                # unknown to the tree (e.g., an attribute that was added at
+                # runtime), so walk the object itself
+                return resolve_controller(node.obj, remainder, trace)
+            node, remainder = child, remainder[1:]
+
+
+class RouteCache(LRUCache):
+    '''
+    A size-bounded LRU cache of resolved routes, usually keyed on the
+    routing path, request method and extension.
+
+    Only routes which were resolved statically are cached; routes which
+    were resolved through ``_lookup`` or ``_route`` are only cached when
+    the resulting controller is flagged with
+    :func:`pecan.decorators.cacheable_route`, and routes which crossed a
+    secured controller boundary are never cached.
+
+    :param maxsize: The maximum number of routes to keep.
+    '''
+
+    def store(self, key, controller, remainder, trace, routing_args=None):
+        '''
+        Caches a resolved route, if it is cacheable.  Returns ``True`` if the
+        route was stored.
+
+        :param key: The cache key for the route.
+        :param controller: The resolved controller.
+        :param remainder: The remainder of the path after routing.
+        :param trace: The set of dynamic routing features consulted while
+                      routing, as populated by ``lookup_controller``.
+        :param routing_args: Any routing arguments set by nested REST
+                             controllers while routing.
+        '''
+        if 'secured' in trace:
+            return False
+        if ('_lookup' in trace or '_route' in trace) and \
+                not _cfg(controller).get('cacheable_route', False):
+            return False
+        self.set(key, (
+            controller,
+            tuple(remainder),
+            tuple(routing_args) if routing_args else None
+        ))
+        return True
@@ -1,14 +1,40 @@
 import cgi
+import os
+from hashlib import md5
+from threading import Lock
+from time import time
+from types import GeneratorType
 
 _builtin_renderers = {}
 error_formatters = []
 
+# the content types of builtin renderers which serialize the namespace
+# rather than rendering a template file
+_builtin_content_types = {
+    'json': 'application/json',
+    'msgpack': 'application/x-msgpack',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+
+class _StreamingRenderer(object):
+    '''
+    A base class for renderers which can stream their output (by
+    implementing ``stream``) in chunks of ``chunk_size``.
+    '''
+
+    #: the approximate size of each chunk of a streamed response (in
+    #: characters, or in bytes for binary formats)
+    chunk_size = 8192
+
+
 #
 # JSON rendering engine
 #
 
 
-class JsonRenderer(object):
+class JsonRenderer(_StreamingRenderer):
     '''
     Defines the builtin ``JSON`` renderer.
     '''
@@ -22,10 +48,179 @@ class JsonRenderer(object):
         from jsonify import encode
         return encode(namespace)
 
+    def stream(self, template_path, namespace):
+        '''
+        Implements streamed ``JSON`` rendering, returning an iterator over
+        chunks of the encoded document.
+        '''
+        from jsonify import iterencode
+        return iterencode(namespace, self.chunk_size)
+
     # TODO: add error formatter for json (pass it through json lint?)
 
 _builtin_renderers['json'] = JsonRenderer
 
+
+#
+# MessagePack rendering engine
+#
+
+class MsgPackRenderer(_StreamingRenderer):
+    '''
+    Defines the builtin ``MessagePack`` renderer.
+    '''
+    def __init__(self, path, extra_vars):
+        pass
+
+    def render(self, template_path, namespace):
+        '''
+        Implements ``MessagePack`` rendering.
+        '''
+        from msgpackify import encode
+        return encode(namespace)
+
+    def stream(self, template_path, namespace):
+        '''
+        Implements streamed ``MessagePack`` rendering, returning an iterator
+        over chunks of the encoded object.  The raw data of large NumPy
+        arrays is passed to the server as is, without being copied into the
+        rest of the response.
+        '''
+        from msgpackify import encode_parts
+        from util import buffer_chunks
+        return buffer_chunks(encode_parts(namespace), self.chunk_size)
+
+_builtin_renderers['msgpack'] = MsgPackRenderer
+
+
+#
+# Record-oriented rendering engines (NDJSON and CSV)
+#
+
+def _records(namespace, batch_size):
+    '''
+    Iterates over the records in ``namespace``: any iterable (including
+    generators and SQLAlchemy ``ResultProxy`` objects, which are read
+    ``batch_size`` rows at a time).  A dictionary is a single record.
+    '''
+    from jsonify import ResultProxy
+    if isinstance(namespace, dict):
+        yield namespace
+    elif isinstance(namespace, ResultProxy):
+        rows = namespace.fetchmany(batch_size)
+        while rows:
+            for row in rows:
+                yield row
+            rows = namespace.fetchmany(batch_size)
+    else:
+        for record in namespace:
+            yield record
+
+
+class NdjsonRenderer(_StreamingRenderer):
+    '''
+    Defines the builtin newline-delimited ``JSON`` renderer, which renders
+    each record of an iterable as ``JSON`` on its own line.
+    '''
+    def __init__(self, path, extra_vars):
+        pass
+
+    #: the number of rows read from a ``ResultProxy`` at a time
+    batch_size = 1000
+
+    def render(self, template_path, namespace):
+        '''
+        Implements newline-delimited ``JSON`` rendering.
+        '''
+        return ''.join(self.stream(template_path, namespace))
+
+    def stream(self, template_path, namespace):
+        '''
+        Implements streamed newline-delimited ``JSON`` rendering, returning
+        an iterator over chunks of the output.
+        '''
+        from jsonify import encode
+        from util import buffer_chunks
+        lines = (
+            encode(record) + '\n'
+            for record in _records(namespace, self.batch_size)
+        )
+        return buffer_chunks(lines, self.chunk_size)
+
+_builtin_renderers['ndjson'] = NdjsonRenderer
+
+
+class _CSVLine(object):
+    '''
+    A file-like object which holds the last line written by a ``csv.writer``.
+    '''
+    line = ''
+
+    def write(self, line):
+        self.line = line
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    elif isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+class CSVRenderer(_StreamingRenderer):
+    '''
+    Defines the builtin ``CSV`` renderer, which renders each record of an
+    iterable as a row.  Records which are mappings (e.g., dictionaries and
+    SQLAlchemy ``RowProxy`` objects) are written in the order of the keys
+    of the first record, which are written first as a header row; records
+    which are neither mappings nor sequences are converted with
+    :mod:`pecan.jsonify`.
+    '''
+    def __init__(self, path, extra_vars):
+        pass
+
+    #: the number of rows read from a ``ResultProxy`` at a time
+    batch_size = 1000
+
+    def render(self, template_path, namespace):
+        '''
+        Implements ``CSV`` rendering.
+        '''
+        return ''.join(self.stream(template_path, namespace))
+
+    def stream(self, template_path, namespace):
+        '''
+        Implements streamed ``CSV`` rendering, returning an iterator over
+        chunks of the output.
+        '''
+        from util import buffer_chunks
+        return buffer_chunks(self._lines(namespace), self.chunk_size)
+
+    def _lines(self, namespace):
+        import csv
+        from jsonify import _instance as converter
+        out = _CSVLine()
+        writer = csv.writer(out)
+        fields = None
+        for record in _records(namespace, self.batch_size):
+            if not isinstance(record, (list, tuple)) and \
+                    not hasattr(record, 'keys'):
+                record = converter.default(record)
+            if hasattr(record, 'keys'):
+                if fields is None:
+                    fields = list(record.keys())
+                    writer.writerow([_csv_value(f) for f in fields])
+                    yield out.line
+                if isinstance(record, dict):
+                    record = [record.get(f) for f in fields]
+                else:
+                    record = [record[f] for f in fields]
+            writer.writerow([_csv_value(v) for v in record])
+            yield out.line
+
+_builtin_renderers['csv'] = CSVRenderer
+
 #
 # Genshi rendering engine
 #
@@ -34,12 +229,19 @@ try:
     from genshi.template import (TemplateLoader,
                                 TemplateError as gTemplateError)
 
-    class GenshiRenderer(object):
+    class GenshiRenderer(_StreamingRenderer):
         '''
         Defines the builtin ``Genshi`` renderer.
         '''
-        def __init__(self, path, extra_vars):
-            self.loader = TemplateLoader([path], auto_reload=True)
+
+        def __init__(self, path, extra_vars, auto_reload=True,
+                     cache_size=None, cache_dir=None):
+            # Genshi templates can't be cached on disk
+            self.loader = TemplateLoader(
+                [path],
+                auto_reload=auto_reload,
+                max_cache_size=cache_size or 25
+            )
             self.extra_vars = extra_vars
 
         def render(self, template_path, namespace):
@@ -50,6 +252,22 @@ try:
             stream = tmpl.generate(**self.extra_vars.make_ns(namespace))
             return stream.render('html')
 
+        def stream(self, template_path, namespace):
+            '''
+            Implements streamed ``Genshi`` rendering, returning an iterator
+            over chunks of the rendered template.
+            '''
+            from util import buffer_chunks
+            tmpl = self.loader.load(template_path)
+            stream = tmpl.generate(**self.extra_vars.make_ns(namespace))
+            return buffer_chunks(stream.serialize('html'), self.chunk_size)
+
+        def load_template(self, template_path):
+            '''
+            Loads (and compiles) a ``Genshi`` template.
+            '''
+            return self.loader.load(template_path)
+
     _builtin_renderers['genshi'] = GenshiRenderer
 
     def format_genshi_error(exc_value):
@@ -70,6 +288,7 @@ except ImportError:                                 # pragma no cover
 #
 
 try:
+    from mako import __version__ as mako_version
     from mako.lookup import TemplateLookup
     from mako.exceptions import CompileException, SyntaxException, \
             html_error_template
@@ -78,10 +297,22 @@ try:
         '''
         Defines the builtin ``Mako`` renderer.
         '''
-        def __init__(self, path, extra_vars):
+        def __init__(self, path, extra_vars, auto_reload=True,
+                     cache_size=None, cache_dir=None):
+            module_directory = None
+            if cache_dir:
+                module_directory = _engine_cache_dir(
+                    cache_dir,
+                    'mako',
+                    mako_version,
+                    path
+                )
             self.loader = TemplateLookup(
                 directories=[path],
-                output_encoding='utf-8'
+                output_encoding='utf-8',
+                filesystem_checks=auto_reload,
+                collection_size=cache_size or -1,
+                module_directory=module_directory
             )
             self.extra_vars = extra_vars
 
@@ -92,6 +323,12 @@ try:
             tmpl = self.loader.get_template(template_path)
             return tmpl.render(**self.extra_vars.make_ns(namespace))
 
+        def load_template(self, template_path):
+            '''
+            Loads (and compiles) a ``Mako`` template.
+            '''
+            return self.loader.get_template(template_path)
+
     _builtin_renderers['mako'] = MakoRenderer
 
     def format_mako_error(exc_value):
@@ -113,12 +350,16 @@ except ImportError:                                 # pragma no cover
 try:
     from kajiki.loader import FileLoader
 
-    class KajikiRenderer(object):
+    class KajikiRenderer(_StreamingRenderer):
         '''
         Defines the builtin ``Kajiki`` renderer.
         '''
-        def __init__(self, path, extra_vars):
-            self.loader = FileLoader(path, reload=True)
+
+        def __init__(self, path, extra_vars, auto_reload=True,
+                     cache_size=None, cache_dir=None):
+            # Kajiki doesn't limit the number of cached templates, and they
+            # can't be cached on disk
+            self.loader = FileLoader(path, reload=auto_reload)
             self.extra_vars = extra_vars
 
         def render(self, template_path, namespace):
@@ -128,6 +369,22 @@ try:
             Template = self.loader.import_(template_path)
             stream = Template(self.extra_vars.make_ns(namespace))
             return stream.render()
+
+        def stream(self, template_path, namespace):
+            '''
+            Implements streamed ``Kajiki`` rendering, returning an iterator
+            over chunks of the rendered template.
+            '''
+            from util import buffer_chunks
+            Template = self.loader.import_(template_path)
+            stream = Template(self.extra_vars.make_ns(namespace))
+            return buffer_chunks(iter(stream), self.chunk_size)
+
+        def load_template(self, template_path):
+            '''
+            Loads (and compiles) a ``Kajiki`` template.
+            '''
+            return self.loader.import_(template_path)
     _builtin_renderers['kajiki'] = KajikiRenderer
     # TODO: add error formatter for kajiki
 except ImportError:                                 # pragma no cover
@@ -137,15 +394,30 @@ except ImportError:                                 # pragma no cover
 # Jinja2 rendering engine
 #
 try:
-    from jinja2 import Environment, FileSystemLoader
+    from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+    from jinja2 import __version__ as jinja_version
     from jinja2.exceptions import TemplateSyntaxError as jTemplateSyntaxError
 
-    class JinjaRenderer(object):
+    class JinjaRenderer(_StreamingRenderer):
         '''
         Defines the builtin ``Jinja`` renderer.
         '''
-        def __init__(self, path, extra_vars):
-            self.env = Environment(loader=FileSystemLoader(path))
+
+        def __init__(self, path, extra_vars, auto_reload=True,
+                     cache_size=None, cache_dir=None):
+            bytecode_cache = None
+            if cache_dir:
+                bytecode_cache = FileSystemBytecodeCache(_engine_cache_dir(
+                    cache_dir,
+                    'jinja',
+                    jinja_version
+                ))
+            self.env = Environment(
+                loader=FileSystemLoader(path),
+                auto_reload=auto_reload,
+                cache_size=cache_size or 400,
+                bytecode_cache=bytecode_cache
+            )
             self.extra_vars = extra_vars
 
         def render(self, template_path, namespace):
@@ -154,6 +426,24 @@ try:
             '''
             template = self.env.get_template(template_path)
             return template.render(self.extra_vars.make_ns(namespace))
+
+        def stream(self, template_path, namespace):
+            '''
+            Implements streamed ``Jinja`` rendering, returning an iterator
+            over chunks of the rendered template.
+            '''
+            from util import buffer_chunks
+            template = self.env.get_template(template_path)
+            return buffer_chunks(
+                template.generate(self.extra_vars.make_ns(namespace)),
+                self.chunk_size
+            )
+
+        def load_template(self, template_path):
+            '''
+            Loads (and compiles) a ``Jinja`` template.
+            '''
+            return self.env.get_template(template_path)
     _builtin_renderers['jinja'] = JinjaRenderer
 
     def format_jinja_error(exc_value):
@@ -174,6 +464,35 @@ except ImportError:                                 # pragma no cover
     pass
 
 
+#
+# compiled template cache helper function
+#
+def _engine_cache_dir(cache_dir, engine, version, template_path=None):
+    '''
+    Returns (and creates, if necessary) the directory within ``cache_dir``
+    in which to cache templates compiled by version ``version`` of the
+    template engine ``engine``, so that templates compiled by a different
+    version are never reused.
+
+    Engines which key their compiled templates by the template's name
+    alone (like Mako) should also pass ``template_path``, so that templates
+    with the same name in different template directories are cached
+    separately.
+    '''
+    path = os.path.join(cache_dir, '%s-%s' % (engine, version))
+    if template_path is not None:
+        path = os.path.join(
+            path,
+            md5(os.path.abspath(template_path)).hexdigest()
+        )
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+    return path
+
+
 #
 # format helper function
 #
@@ -235,6 +554,121 @@ class ExtraNamespace(object):
             return ns
 
 
+#
+# Fragment Caching
+#
+class _Fragment(unicode):
+    '''
+    A cached fragment of rendered markup, which template engines include
+    without escaping it again.
+    '''
+    def __html__(self):
+        return self
+
+
+def _fragment_value(value):
+    '''
+    Converts the result of rendering a template fragment (e.g., a Jinja
+    macro, a Kajiki ``py:def``, a captured Mako ``def`` or a Genshi
+    ``Stream``) into a cacheable value.
+    '''
+    if hasattr(value, '__html__'):
+        return _Fragment(value.__html__())
+    elif hasattr(value, 'accumulate_str'):
+        # Kajiki functions return a lazily rendered `flattener`
+        return _Fragment(value.accumulate_str())
+    elif isinstance(value, GeneratorType):
+        raise TypeError(
+            'Generators can\'t be cached as template fragments (Genshi '
+            '`py:def` functions are evaluated by the template which calls '
+            'them); render the fragment as a separate template instead.'
+        )
+    return value
+
+
+class FragmentCache(object):
+    '''
+    Caches fragments of rendered templates (e.g., sidebars or navigation
+    which are the same on many pages), so that they are rendered once per
+    ``ttl`` rather than on every request.  To make it available to every
+    template, pass it to your application as an extra template variable::
+
+        app = make_app(
+            RootController(),
+            extra_template_vars={'cache': FragmentCache(MemoryBackend())}
+        )
+
+    and call it with the name of the fragment and a function which renders
+    it, such as a Jinja macro::
+
+        {{ cache('sidebar', sidebar, vary=[user.id]) }}
+
+    :param backend: where to store fragments; one of the backends in
+                    :mod:`pecan.cache`.  Defaults to a
+                    :class:`~pecan.cache.MemoryBackend`.
+    :param ttl: the default lifetime of fragments, in seconds (or ``None``
+                to cache them until they're evicted).
+    '''
+
+    def __init__(self, backend=None, ttl=300):
+        if backend is None:
+            from cache import MemoryBackend
+            backend = MemoryBackend()
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._lock = Lock()
+
+    def key(self, name, vary=()):
+        '''
+        Returns the cache key for the fragment ``name``.
+
+        :param name: the name of the fragment
+        :param vary: a sequence of values which the fragment varies by
+                     (e.g., the current user's ID); each combination of
+                     values is cached separately.
+        '''
+        return 'fragment:%s:%r' % (name, tuple(vary))
+
+    def __call__(self, name, render, vary=(), ttl=None):
+        '''
+        Returns the cached fragment ``name``, calling ``render`` to render
+        (and cache) it if it isn't cached.
+
+        :param name: the name of the fragment
+        :param render: a function, taking no arguments, which renders the
+                       fragment
+        :param vary: a sequence of values which the fragment varies by
+        :param ttl: the lifetime of the fragment, in seconds.  Defaults to
+                    the cache's ``ttl``.
+        '''
+        key = self.key(name, vary)
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            value = _fragment_value(render())
+            self.backend.set(key, value, self.ttl if ttl is None else ttl)
+        return value
+
+    def invalidate(self, name, vary=()):
+        '''
+        Removes the fragment ``name`` (for the values ``vary``) from the
+        cache, so that it's rendered again on its next use.
+        '''
+        self.backend.delete(self.key(name, vary))
+
+    @property
+    def stats(self):
+        '''
+        A dictionary with the number of cache ``hits`` and ``misses``.
+        '''
+        return dict(hits=self.hits, misses=self.misses)
+
+
 #
 # Rendering Factory
 #
@@ -244,12 +678,29 @@ class RendererFactory(object):
 
     :param custom_renderers: custom-defined renderers to manufacture
     :param extra_vars: extra vars for the template namespace
+    :param auto_reload: whether the builtin template renderers should check
+                        template files for changes (and reload them) when
+                        rendering.  Disable this in production to save the
+                        filesystem checks.
+    :param cache_size: the number of compiled templates the builtin
+                       template renderers should keep in memory, or
+                       ``None`` to use each template engine's default.
+    :param cache_dir: a directory in which the builtin template renderers
+                      which support it (Mako and Jinja2) should store
+                      compiled templates, so that they can be reused by
+                      other processes (and after restarts).
     '''
-    def __init__(self, custom_renderers={}, extra_vars={}):
+    def __init__(self, custom_renderers={}, extra_vars={}, auto_reload=True,
+                 cache_size=None, cache_dir=None):
         self._renderers = {}
         self._renderer_classes = dict(_builtin_renderers)
         self.add_renderers(custom_renderers)
         self.extra_vars = ExtraNamespace(extra_vars)
+        self.template_options = dict(
+            auto_reload=auto_reload,
+            cache_size=cache_size,
+            cache_dir=cache_dir
+        )
 
     def add_renderers(self, custom_dict):
         '''
@@ -278,6 +729,47 @@ class RendererFactory(object):
             cls = self._renderer_classes.get(name)
             if cls is None:
                 return None
+            elif cls is _builtin_renderers.get(name) and \
+                    name not in _builtin_content_types:
+                # only the builtin template renderers take options
+                self._renderers[name] = cls(
+                    template_path,
+                    self.extra_vars,
+                    **self.template_options
+                )
             else:
                 self._renderers[name] = cls(template_path, self.extra_vars)
         return self._renderers[name]
+
+    def load_templates(self, name, template_path):
+        '''
+        Loads (and compiles) every template file in ``template_path`` (and
+        its subdirectories) with the renderer ``name``, so that they are
+        cached by the renderer (and on disk, if a ``cache_dir`` is used).
+        Yields a ``(template, seconds, error)`` tuple for each template,
+        where ``error`` is the exception raised while loading it, if any.
+
+        :param name: name of the renderer to load the templates with
+        :param template_path: path to the templates
+        '''
+        renderer = self.get(name, template_path)
+        if not hasattr(renderer, 'load_template'):
+            raise ValueError(
+                'The `%s` renderer does not load templates.' % name
+            )
+        for dirpath, dirnames, filenames in os.walk(template_path):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            for filename in sorted(filenames):
+                if filename.startswith('.'):
+                    continue
+                template = os.path.relpath(
+                    os.path.join(dirpath, filename),
+                    template_path
+                ).replace(os.sep, '/')
+                start = time()
+                try:
+                    renderer.load_template(template)
+                except Exception, e:
+                    yield template, time() - start, e
+                else:
+                    yield template, time() - start, None
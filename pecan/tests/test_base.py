@@ -14,7 +14,7 @@ from pecan import (
 from pecan.templating import (
     _builtin_renderers as builtin_renderers, error_formatters
 )
-from pecan.decorators import accept_noncanonical
+from pecan.decorators import accept_noncanonical, cacheable_route, cached
 
 import os
 
@@ -179,6 +179,719 @@ class TestLookups(unittest.TestCase):
             assert r.status_int == 404
 
 
+class TestCompiledRoutes(unittest.TestCase):
+
+    @property
+    def app_(self):
+        class LookupController(object):
+            def __init__(self, someID):
+                self.someID = someID
+
+            @expose()
+            def index(self):
+                return '/lookup/%s' % self.someID
+
+        class LookupParent(object):
+            @expose()
+            def _lookup(self, someID, *remainder):
+                return LookupController(someID), remainder
+
+        class SubController(object):
+            @expose()
+            def index(self):
+                return '/sub/'
+
+            @expose()
+            def deeper(self):
+                return '/sub/deeper'
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return '/'
+
+            @property
+            def dynamic(self):
+                return SubController()
+
+            sub = SubController()
+            lookup = LookupParent()
+
+        return TestApp(Pecan(RootController(), compile_routes=True))
+
+    def test_tree_is_compiled(self):
+        tree = self.app_.app.route_tree
+        assert tree.root.index is not None
+        assert set(tree.root.children.keys()) == set(['sub', 'lookup'])
+        assert tree.root.children['lookup'].dynamic is True
+        assert 'deeper' in tree.root.children['sub'].controllers
+        assert 'dynamic' not in tree.root.children
+
+    def test_static_routes(self):
+        app = self.app_
+        assert app.get('/').body == '/'
+        assert app.get('/sub/').body == '/sub/'
+        assert app.get('/sub/deeper').body == '/sub/deeper'
+
+    def test_noncanonical_redirect(self):
+        r = self.app_.get('/sub')
+        assert r.status_int == 302
+        assert r.location == 'http://localhost/sub/'
+
+    def test_lookup_fallback(self):
+        r = self.app_.get('/lookup/100/')
+        assert r.status_int == 200
+        assert r.body == '/lookup/100'
+
+    def test_descriptors_are_resolved_dynamically(self):
+        r = self.app_.get('/dynamic/deeper')
+        assert r.status_int == 200
+        assert r.body == '/sub/deeper'
+
+    def test_runtime_attributes_are_resolved_dynamically(self):
+        app = self.app_
+
+        class Extra(object):
+            @expose()
+            def index(self):
+                return '/extra/'
+
+        app.app.root.extra = Extra()
+        r = app.get('/extra/')
+        assert r.status_int == 200
+        assert r.body == '/extra/'
+
+    def test_not_found(self):
+        app = self.app_
+        r = app.get('/missing', expect_errors=True)
+        assert r.status_int == 404
+        r = app.get('/sub/missing/deeper', expect_errors=True)
+        assert r.status_int == 404
+
+    def test_shared_objects_are_compiled_once(self):
+        class Level(object):
+            def __init__(self, depth, child):
+                self.depth = depth
+                self.a = self.b = child
+
+            @expose()
+            def index(self):
+                return str(self.depth)
+
+        # every level is reachable through 2 ** depth paths
+        level = None
+        for depth in range(40, -1, -1):
+            level = Level(depth, level)
+
+        app = Pecan(level, compile_routes=True)
+        tree = app.route_tree
+        assert tree.root.children['a'] is tree.root.children['b']
+        assert TestApp(app).get('/a/b/a/b/').body == '4'
+
+    def test_only_controllers_are_compiled(self):
+        class SubController(object):
+            @expose()
+            def index(self):
+                return '/group/sub/'
+
+        class Group(object):
+            sub = SubController()
+
+        class Pool(object):
+            size = 5
+
+        class Engine(object):
+            pool = Pool()
+
+        class RootController(object):
+            group = Group()
+            engine = Engine()
+
+        app = Pecan(RootController(), compile_routes=True)
+        assert app.route_tree.root.children == {}
+        assert TestApp(app).get('/group/sub/').body == '/group/sub/'
+
+
+class TestRouteCache(unittest.TestCase):
+
+    @property
+    def app_(self):
+        class LookupController(object):
+            def __init__(self, someID):
+                self.someID = someID
+
+            @expose()
+            def index(self):
+                return '/lookup/%s' % self.someID
+
+            @cacheable_route
+            @expose()
+            def cacheable(self):
+                return '/lookup/%s/cacheable' % self.someID
+
+        class LookupParent(object):
+            @expose()
+            def _lookup(self, someID, *remainder):
+                return LookupController(someID), remainder
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return '/'
+
+            @expose()
+            def args(self, *args):
+                return ','.join(args)
+
+            lookup = LookupParent()
+
+        return TestApp(Pecan(RootController(), route_cache_size=10))
+
+    def test_static_routes_are_cached(self):
+        app = self.app_
+        papp = app.app
+        assert app.get('/args/a/b').body == 'a,b'
+        assert app.get('/args/a/b').body == 'a,b'
+        assert papp.route_cache.misses == 1
+        assert papp.route_cache.hits == 1
+
+    def test_cache_key_includes_method(self):
+        app = self.app_
+        papp = app.app
+        app.get('/')
+        app.post('/')
+        assert papp.route_cache.misses == 2
+        assert len(papp.route_cache) == 2
+
+    def test_lookup_routes_are_not_cached(self):
+        app = self.app_
+        papp = app.app
+        assert app.get('/lookup/1/').body == '/lookup/1'
+        assert app.get('/lookup/1/').body == '/lookup/1'
+        assert papp.route_cache.hits == 0
+        assert len(papp.route_cache) == 0
+
+    def test_cacheable_lookup_routes(self):
+        app = self.app_
+        papp = app.app
+        assert app.get('/lookup/1/cacheable').body == '/lookup/1/cacheable'
+        assert app.get('/lookup/1/cacheable').body == '/lookup/1/cacheable'
+        assert papp.route_cache.hits == 1
+
+    def test_secured_routes_are_not_cached(self):
+        from pecan.secure import SecureController
+
+        class SecretController(SecureController):
+            authorized = True
+
+            @classmethod
+            def check_permissions(cls):
+                return cls.authorized
+
+            @cacheable_route
+            @expose()
+            def index(self):
+                return 'secret'
+
+        class RootController(object):
+            secret = SecretController()
+
+        papp = Pecan(RootController(), route_cache_size=10)
+        app = TestApp(papp)
+        assert app.get('/secret/').body == 'secret'
+        assert len(papp.route_cache) == 0
+
+        SecretController.authorized = False
+        r = app.get('/secret/', expect_errors=True)
+        assert r.status_int == 401
+
+
+class TestNotFoundCache(unittest.TestCase):
+
+    @property
+    def app_(self):
+        class DefaultController(object):
+            @expose()
+            def _default(self, *remainder):
+                abort(404)
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return '/'
+
+            default = DefaultController()
+
+        return TestApp(Pecan(RootController(), notfound_cache_size=10))
+
+    def test_static_misses_are_cached(self):
+        app = self.app_
+        papp = app.app
+        for i in range(2):
+            r = app.get('/missing', expect_errors=True)
+            assert r.status_int == 404
+        assert 'missing' not in papp.notfound_cache
+        assert '/missing' in papp.notfound_cache
+        assert papp.notfound_cache.hits == 1
+
+    def test_default_misses_are_not_cached(self):
+        app = self.app_
+        papp = app.app
+        r = app.get('/default/missing', expect_errors=True)
+        assert r.status_int == 404
+        assert len(papp.notfound_cache) == 0
+
+    def test_reset_routing(self):
+        app = self.app_
+        papp = app.app
+        app.get('/later', expect_errors=True)
+
+        class Later(object):
+            @expose()
+            def index(self):
+                return '/later/'
+
+        papp.root.later = Later()
+        r = app.get('/later/', expect_errors=True)
+        assert r.status_int == 200
+        r = app.get('/later', expect_errors=True)
+        assert r.status_int == 404
+
+        papp.reset_routing()
+        assert len(papp.notfound_cache) == 0
+        r = app.get('/later')
+        assert r.status_int == 302
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    @property
+    def app_(self):
+        calls = self.calls
+
+        class RootController(object):
+            @cached(ttl=60)
+            @expose('json')
+            @expose('msgpack')
+            def index(self, **kw):
+                calls.append(kw)
+                response.headers['X-Calls'] = str(len(calls))
+                return dict(calls=len(calls))
+
+            @cached(vary=['q'], vary_headers=['Accept-Language'])
+            @expose(content_type='text/plain')
+            def search(self, q='', page='1'):
+                calls.append(q)
+                return '%s:%s:%d' % (q, page, len(calls))
+
+            @cached()
+            @expose(content_type='text/plain')
+            def missing(self):
+                calls.append(True)
+                abort(404)
+
+            @cached()
+            @expose(content_type='text/plain')
+            def cookie(self):
+                calls.append(True)
+                response.set_cookie('session', 'value')
+                return 'cookie'
+
+            @cached()
+            @expose(content_type='text/plain')
+            def streamed(self):
+                calls.append(True)
+                yield 'streamed'
+
+            @cached(ttl=0.05)
+            @expose(content_type='text/plain')
+            def brief(self):
+                calls.append(True)
+                return str(len(calls))
+
+        return TestApp(Pecan(RootController()))
+
+    def test_hit_skips_controller(self):
+        app = self.app_
+        r1 = app.get('/index.msgpack')
+        r2 = app.get('/index.msgpack')
+        assert len(self.calls) == 1
+        assert r2.body == r1.body
+        assert r2.content_type == 'application/x-msgpack'
+        assert r2.headers['X-Calls'] == '1'
+
+    def test_content_types_are_cached_separately(self):
+        app = self.app_
+        assert app.get('/index.json').json == dict(calls=1)
+        assert app.get('/index.msgpack').headers['X-Calls'] == '2'
+        r = app.get('/index.json')
+        assert r.content_type == 'application/json'
+        assert r.json == dict(calls=1)
+        assert len(self.calls) == 2
+
+    def test_vary_by_query_string(self):
+        app = self.app_
+        app.get('/index.json?a=1&b=2')
+        app.get('/index.json?b=2&a=1')
+        assert len(self.calls) == 1
+        app.get('/index.json?a=2&b=2')
+        assert len(self.calls) == 2
+
+    def test_vary_params_and_headers(self):
+        app = self.app_
+        assert app.get('/search?q=x&page=1').body == 'x:1:1'
+        assert app.get('/search?q=x&page=2').body == 'x:1:1'
+        assert app.get('/search?q=y').body == 'y:1:2'
+
+        r = app.get('/search?q=x', headers={'Accept-Language': 'fr'})
+        assert r.body == 'x:1:3'
+        assert 'Accept-Language' in r.headers['Vary']
+        r = app.get('/search?q=x', headers={'Accept-Language': 'fr'})
+        assert r.body == 'x:1:3'
+
+    def test_only_get_and_head_are_cached(self):
+        app = self.app_
+        app.head('/search')
+        app.get('/search')
+        app.post('/search')
+        app.post('/search')
+        assert len(self.calls) == 3
+
+    def test_unsuccessful_responses_are_not_cached(self):
+        app = self.app_
+        for path in ('/missing', '/cookie', '/streamed'):
+            app.get(path, expect_errors=True)
+            app.get(path, expect_errors=True)
+        assert len(self.calls) == 6
+
+    def test_ttl(self):
+        import time
+        app = self.app_
+        assert app.get('/brief').body == '1'
+        assert app.get('/brief').body == '1'
+        time.sleep(0.1)
+        assert app.get('/brief').body == '2'
+
+    def test_before_hooks_run_on_hits(self):
+        from pecan.hooks import PecanHook
+
+        run_hooks = []
+
+        class SimpleHook(PecanHook):
+            def before(self, state):
+                run_hooks.append('before')
+
+        app = self.app_
+        app.app.hooks = [SimpleHook()]
+        app.get('/index.msgpack')
+        app.get('/index.msgpack')
+        assert run_hooks == ['before', 'before']
+        assert len(self.calls) == 1
+
+    def test_headers_set_by_hooks_are_not_cached(self):
+        from itertools import count
+        from pecan.hooks import PecanHook
+
+        ids = count()
+
+        class RequestIdHook(PecanHook):
+            def before(self, state):
+                state.response.headers['X-Request-Id'] = str(ids.next())
+
+        app = self.app_
+        app.app.hooks = [RequestIdHook()]
+        responses = [app.get('/index.msgpack') for i in range(3)]
+        assert [r.headers['X-Request-Id'] for r in responses] == \
+            ['0', '1', '2']
+        assert [r.headers['X-Calls'] for r in responses] == ['1'] * 3
+        assert all(
+            r.content_type == 'application/x-msgpack' for r in responses
+        )
+        assert len(self.calls) == 1
+
+    def test_shared_backend(self):
+        import shutil
+        import tempfile
+        from pecan.cache import FileBackend
+
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        backend = FileBackend(path)
+
+        # e.g., two worker processes
+        for i in range(2):
+            app = self.app_
+            app.app.response_cache = backend
+            r = app.get('/index.msgpack')
+            assert r.headers['X-Calls'] == '1'
+        assert len(self.calls) == 1
+
+
+class TestCoalescedRequests(unittest.TestCase):
+
+    def setUp(self):
+        import threading
+        self.calls = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    @property
+    def app_(self):
+        calls = self.calls
+        test = self
+
+        class RootController(object):
+            @cached(coalesce=True)
+            @expose(content_type='text/plain')
+            def index(self):
+                calls.append(True)
+                test.entered.set()
+                test.release.wait()
+                return 'calls=%d' % len(calls)
+
+            @cached(coalesce=True)
+            @expose(content_type='text/plain')
+            def cookie(self):
+                calls.append(True)
+                test.entered.set()
+                test.release.wait()
+                response.set_cookie('session', str(len(calls)))
+                return 'calls=%d' % len(calls)
+
+        return TestApp(Pecan(RootController()))
+
+    def get_concurrently(self, app, path, followers=4):
+        import threading
+        import time
+        from webob import Request
+
+        responses = []
+
+        def get():
+            responses.append(Request.blank(path).get_response(app.app))
+
+        leader = threading.Thread(target=get)
+        leader.start()
+        self.entered.wait(5)
+        threads = [threading.Thread(target=get) for i in range(followers)]
+        for thread in threads:
+            thread.start()
+        # give the followers time to start waiting for the leader
+        time.sleep(0.1)
+        self.release.set()
+        for thread in [leader] + threads:
+            thread.join(5)
+        return responses
+
+    def test_followers_share_response(self):
+        app = self.app_
+        responses = self.get_concurrently(app, '/index')
+        assert len(self.calls) == 1
+        assert [r.body for r in responses] == ['calls=1'] * 5
+        assert all(r.content_type == 'text/plain' for r in responses)
+        assert len(app.app.flights) == 0
+
+    def test_followers_call_controller_for_unshareable_responses(self):
+        app = self.app_
+        responses = self.get_concurrently(app, '/cookie')
+        assert len(self.calls) == 5
+        assert all(r.status_int == 200 for r in responses)
+        assert len(app.app.flights) == 0
+
+    def test_followers_stop_waiting_after_timeout(self):
+        app = self.app_
+        app.app.coalesce_timeout = 0.01
+        responses = self.get_concurrently(app, '/index')
+        assert len(self.calls) == 5
+        assert all(r.status_int == 200 for r in responses)
+        assert len(app.app.flights) == 0
+
+    def test_controller_timeout(self):
+        app = self.app_
+        app.app.root.index._pecan['cache']['coalesce'] = 0.01
+        self.get_concurrently(app, '/index')
+        assert len(self.calls) == 5
+
+    def test_requests_are_not_coalesced_without_option(self):
+        app = self.app_
+        app.app.root.index._pecan['cache']['coalesce'] = False
+        self.get_concurrently(app, '/index')
+        assert len(self.calls) == 5
+
+
+class TestETags(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.versions = {'1': 'v1'}
+
+    @property
+    def app_(self):
+        calls = self.calls
+        versions = self.versions
+
+        class RootController(object):
+            @expose('json', etag=True)
+            def hashed(self):
+                calls.append(True)
+                return dict(name='Jonathan')
+
+            @expose('json')
+            @expose('msgpack', etag=lambda id: versions[id])
+            def versioned(self, id):
+                calls.append(id)
+                return dict(id=id, version=versions[id])
+
+            @expose('json')
+            def plain(self):
+                calls.append(True)
+                return dict(name='Jonathan')
+
+            @expose('json', etag=False)
+            def disabled(self):
+                calls.append(True)
+                return dict(name='Jonathan')
+
+            @expose(etag=True)
+            def streamed(self):
+                yield 'streamed'
+
+            @expose('json', etag=True)
+            def tagged(self):
+                calls.append(True)
+                response.etag = 'custom'
+                return dict(name='Jonathan')
+
+        return TestApp(Pecan(RootController()))
+
+    def test_hashed_etag(self):
+        app = self.app_
+        r = app.get('/hashed')
+        assert r.etag
+
+        r = app.get('/hashed', headers={'If-None-Match': '"%s"' % r.etag})
+        assert r.status_int == 304
+        assert r.body == ''
+
+        r = app.get('/hashed', headers={'If-None-Match': '"stale"'})
+        assert r.status_int == 200
+        assert r.json == dict(name='Jonathan')
+
+    def test_version_etag_skips_controller(self):
+        app = self.app_
+        r = app.get('/versioned/1')
+        assert r.json == dict(id='1', version='v1')
+        assert len(self.calls) == 1
+
+        etag = '"%s"' % r.etag
+        r = app.get('/versioned/1', headers={'If-None-Match': etag})
+        assert r.status_int == 304
+        assert r.etag == etag.strip('"')
+        assert 'Content-Type' not in r.headers
+        assert len(self.calls) == 1
+
+        self.versions['1'] = 'v2'
+        r = app.get('/versioned/1', headers={'If-None-Match': etag})
+        assert r.status_int == 200
+        assert r.json == dict(id='1', version='v2')
+        assert len(self.calls) == 2
+
+    def test_version_etag_varies_by_content_type(self):
+        app = self.app_
+        assert app.get('/versioned/1.json').etag != \
+            app.get('/versioned/1.msgpack').etag
+
+    def test_app_wide_etags(self):
+        app = self.app_
+        assert app.get('/plain').etag is None
+
+        app = self.app_
+        app.app.generate_etags = True
+        etag = app.get('/plain').etag
+        assert etag
+        r = app.get('/plain', headers={'If-None-Match': '"%s"' % etag})
+        assert r.status_int == 304
+        assert app.get('/disabled').etag is None
+
+    def test_controller_etags_are_kept(self):
+        for generate_etags in (False, True):
+            app = self.app_
+            app.app.generate_etags = generate_etags
+            assert app.get('/tagged').etag == 'custom'
+            r = app.get('/tagged', headers={'If-None-Match': '"custom"'})
+            assert r.status_int == 304
+
+    def test_etags_only_for_get_and_head(self):
+        app = self.app_
+        assert app.head('/hashed').etag
+        assert app.post('/hashed').etag is None
+
+    def test_streamed_responses_are_not_hashed(self):
+        r = self.app_.get('/streamed')
+        assert r.body == 'streamed'
+        assert r.etag is None
+
+    def test_cached_responses(self):
+        class RootController(object):
+            @cached()
+            @expose('json', etag=True)
+            def index(self):
+                return dict(name='Jonathan')
+
+        app = TestApp(Pecan(RootController()))
+        etag = app.get('/').etag
+        r = app.get('/', headers={'If-None-Match': '"%s"' % etag})
+        assert r.status_int == 304
+        assert r.body == ''
+
+
+class TestResolveController(unittest.TestCase):
+
+    def setUp(self):
+        class SubController(object):
+            @expose()
+            def _default(self, *remainder):
+                return 'default'
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return '/'
+
+            sub = SubController()
+
+        self.root = RootController()
+
+    def test_resolve_returns_none_when_not_found(self):
+        from pecan.routing import resolve_controller
+        assert resolve_controller(self.root, ['missing']) is None
+
+    def test_resolve_default(self):
+        from pecan.routing import resolve_controller
+        root = self.root
+        trace = set()
+        controller, remainder = resolve_controller(
+            root, ['sub', 'missing'], trace
+        )
+        assert controller == root.sub._default
+        assert remainder == ['missing']
+        assert trace == set(['_default'])
+
+    def test_lookup_and_find_still_raise(self):
+        from webob.exc import HTTPNotFound
+        from pecan.routing import lookup_controller, find_object
+        root = self.root
+        self.assertRaises(
+            HTTPNotFound, lookup_controller, root, ['missing']
+        )
+        self.assertRaises(
+            HTTPNotFound, find_object, root, ['missing'], []
+        )
+
+
 class TestControllerArguments(unittest.TestCase):
 
     @property
@@ -640,6 +1353,58 @@ class TestControllerArguments(unittest.TestCase):
         assert r.status_int == 200
         assert r.body == 'variable_all: 7, day=12, id=seven, month=1'
 
+    def test_body_not_parsed_without_arguments(self):
+        environs = []
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                environs.append(request.environ)
+                return 'index'
+
+            @expose()
+            def named(self, id=None):
+                environs.append(request.environ)
+                return 'named: %s' % id
+
+        app = TestApp(Pecan(RootController()))
+        r = app.post('/', {'id': 'seven'})
+        assert r.body == 'index'
+        assert 'webob._parsed_post_vars' not in environs[-1]
+
+        r = app.post('/named', {'id': 'seven'})
+        assert r.body == 'named: seven'
+        assert 'webob._parsed_post_vars' in environs[-1]
+
+    def test_get_args_override(self):
+        class RootController(object):
+            @expose()
+            def index(self, id=None):
+                return 'index: %s' % id
+
+        class CustomPecan(Pecan):
+            def get_args(self, all_params, remainder, argspec, im_self):
+                args, kwargs = super(CustomPecan, self).get_args(
+                    all_params, remainder, argspec, im_self
+                )
+                return [arg.upper() for arg in args], kwargs
+
+        app = TestApp(CustomPecan(RootController()))
+        r = app.get('/', {'id': 'seven'})
+        assert r.body == 'index: SEVEN'
+
+    def test_binder_compiled_once(self):
+        class RootController(object):
+            @expose()
+            def index(self, id=None):
+                return 'index: %s' % id
+
+        app = TestApp(Pecan(RootController()))
+        assert app.get('/?id=1').body == 'index: 1'
+        binder = RootController.index._pecan['binder']
+        assert app.get('/?id=2').body == 'index: 2'
+        assert RootController.index._pecan['binder'] is binder
+
     def test_no_remainder(self):
         try:
             r = self.app_.get('/eater')
@@ -830,6 +1595,102 @@ class TestStreamedResponse(unittest.TestCase):
         assert r.content_type == 'text/plain'
         assert r.body == 'plain text'
 
+    def test_generator_response(self):
+        from pecan.hooks import PecanHook
+
+        run_hooks = []
+
+        class SimpleHook(PecanHook):
+            def after(self, state):
+                run_hooks.append('after')
+
+        class RootController(object):
+            @expose(content_type='text/csv')
+            def export(self):
+                yield 'a,b\n'
+                for i in range(3):
+                    yield u'%d,\u2713\n' % i
+
+        from webob import Request
+        app = Pecan(RootController(), hooks=[SimpleHook()])
+        status, headers, app_iter = Request.blank('/export').call_application(
+            app
+        )
+        assert status == '200 OK'
+        assert dict(headers)['Content-Type'].startswith('text/csv')
+        assert 'Content-Length' not in dict(headers)
+        assert run_hooks == ['after']
+        assert ''.join(app_iter) == 'a,b\n' + ''.join(
+            (u'%d,\u2713\n' % i).encode('utf-8') for i in range(3)
+        )
+
+    def test_iterator_response_is_closed(self):
+        closed = []
+
+        class Chunks(object):
+            def __init__(self):
+                self.chunks = iter(['one', 'two'])
+
+            def __iter__(self):
+                return self
+
+            def next(self):
+                return self.chunks.next()
+
+            def close(self):
+                closed.append(True)
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return Chunks()
+
+        app = TestApp(Pecan(RootController()))
+        r = app.get('/')
+        assert r.body == 'onetwo'
+        assert closed == [True]
+
+    def test_request_state_while_streaming(self):
+        from pecan.core import state
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                yield 'path='
+                yield request.path
+
+        from webob import Request
+        app = Pecan(RootController())
+        status, headers, app_iter = Request.blank('/').call_application(
+            app
+        )
+        assert state.__dict__.keys() == ['app']
+        assert ''.join(app_iter) == 'path=/'
+        assert state.__dict__.keys() == ['app']
+
+    def test_body_read_by_after_hook(self):
+        from pecan.core import state
+        from pecan.hooks import PecanHook
+
+        lengths = []
+
+        class LengthHook(PecanHook):
+            def after(self, state):
+                lengths.append(len(state.response.body))
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                yield 'path='
+                yield request.path
+
+        app = TestApp(Pecan(RootController(), hooks=[LengthHook()]))
+        r = app.get('/')
+        assert r.status_int == 200
+        assert r.body == 'path=/'
+        assert lengths == [6]
+        assert state.__dict__.keys() == ['app']
+
 
 class TestStateCleanup(unittest.TestCase):
 
@@ -853,6 +1714,56 @@ class TestStateCleanup(unittest.TestCase):
         assert state.__dict__.keys() == ['app']
 
 
+class TestContextLocal(unittest.TestCase):
+
+    def setUp(self):
+        from pecan import core
+        self._state = core.state
+
+    def tearDown(self):
+        from pecan import core
+        core.state = self._state
+
+    def test_proxy_reads_and_writes_through(self):
+        from pecan import core
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                response.status = 201
+                request.seen = True
+                return '%s %s' % (request.path, core.state.request.seen)
+
+        app = TestApp(Pecan(RootController()))
+        r = app.get('/')
+        assert r.status_int == 201
+        assert r.body == '/ True'
+
+    def test_custom_context_local(self):
+        from threading import local
+        from pecan import core
+
+        created = []
+
+        class CustomLocal(local):
+            def __init__(self):
+                created.append(self)
+
+        core.set_context_local(CustomLocal)
+        assert core.state is created[0]
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return request.path
+
+        app = TestApp(Pecan(RootController()))
+        r = app.get('/')
+        assert r.status_int == 200
+        assert r.body == '/'
+        assert core.state.__dict__.keys() == ['app']
+
+
 class TestFileTypeExtensions(unittest.TestCase):
 
     @property
@@ -1253,6 +2164,36 @@ class TestEngines(unittest.TestCase):
                     break
         assert error_msg is not None
 
+    def test_streamed_templates(self):
+        from webob import Request
+
+        for name in ('genshi', 'kajiki', 'jinja', 'mako'):
+            if name not in builtin_renderers:
+                continue
+            template = '%s:%s.html' % (name, name)
+
+            class RootController(object):
+                @expose(template)
+                def index(self, name='Jonathan'):
+                    return dict(name=name)
+
+                @expose(template, stream=True)
+                def streamed(self, name='Jonathan'):
+                    return dict(name=name)
+
+            app = Pecan(RootController(), template_path=self.template_path)
+            expected = TestApp(app).get('/?name=World').body
+
+            status, headers, app_iter = Request.blank(
+                '/streamed?name=World'
+            ).call_application(app)
+            assert status == '200 OK'
+            assert dict(headers)['Content-Type'].startswith('text/html')
+            assert ''.join(app_iter) == expected, name
+            if name != 'mako':
+                # Mako can't render incrementally, so it isn't streamed
+                assert 'Content-Length' not in dict(headers)
+
     def test_json(self):
         try:
             from simplejson import loads
@@ -0,0 +1,210 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from SocketServer import StreamRequestHandler, ThreadingTCPServer
+from unittest import TestCase
+
+from pecan.cache import MemoryBackend, FileBackend, MemcachedBackend
+
+
+class BackendTests(object):
+
+    def test_get_and_set(self):
+        backend = self.backend()
+        assert backend.get('missing') is None
+        assert backend.get('missing', 'default') == 'default'
+        backend.set('key', {'value': [1, 2]})
+        backend.set(u'key-\u2713', u'\u2713')
+        assert backend.get('key') == {'value': [1, 2]}
+        assert backend.get(u'key-\u2713') == u'\u2713'
+
+    def test_ttl(self):
+        backend = self.backend()
+        backend.set('expired', 'value', ttl=0.05)
+        backend.set('fresh', 'value', ttl=60)
+        time.sleep(0.1)
+        assert backend.get('expired') is None
+        assert backend.get('fresh') == 'value'
+
+    def test_delete_and_clear(self):
+        backend = self.backend()
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.delete('a')
+        backend.delete('missing')
+        assert backend.get('a') is None
+        assert backend.get('b') == 2
+        backend.clear()
+        assert backend.get('b') is None
+
+
+class TestMemoryBackend(BackendTests, TestCase):
+
+    def backend(self):
+        return MemoryBackend()
+
+    def test_eviction(self):
+        backend = MemoryBackend(maxsize=2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get('a')
+        backend.set('c', 3)
+        assert backend.get('a') == 1
+        assert backend.get('b') is None
+        assert backend.get('c') == 3
+
+
+class TestFileBackend(BackendTests, TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def backend(self):
+        return FileBackend(self.path + '/cache')
+
+    def test_shared_between_instances(self):
+        self.backend().set('key', 'value')
+        assert self.backend().get('key') == 'value'
+
+    def test_corrupt_file(self):
+        backend = self.backend()
+        backend.set('key', 'value')
+        with open(backend._filename('key'), 'wb') as f:
+            f.write('garbage')
+        assert backend.get('key') is None
+
+    def test_unwritable_directory(self):
+        backend = self.backend()
+        backend.set('key', 'value')
+
+        # replace the cache directory with a file, so nothing can be
+        # written to (or read from) it
+        shutil.rmtree(backend.path)
+        open(backend.path, 'w').close()
+        backend.set('key', 'value')
+        assert backend.get('key') is None
+        backend.delete('key')
+
+    def test_failed_write_is_cleaned_up(self):
+        backend = self.backend()
+
+        class Unpicklable(object):
+            def __reduce__(self):
+                raise IOError('disk full')
+
+        backend.set('key', Unpicklable())
+        assert backend.get('key') is None
+        assert os.listdir(backend.path) == []
+
+    def test_replace_on_windows(self):
+        backend = self.backend()
+        backend.set('key', 'old')
+
+        # like Windows, refuse to rename over an existing file
+        rename = os.rename
+
+        def windows_rename(src, dst):
+            if os.path.exists(dst):
+                raise OSError('file exists')
+            rename(src, dst)
+
+        os.rename = windows_rename
+        try:
+            backend.set('key', 'new')
+        finally:
+            os.rename = rename
+        assert backend.get('key') == 'new'
+        assert os.listdir(backend.path) == [os.path.basename(
+            backend._filename('key')
+        )]
+
+
+class MemcachedHandler(StreamRequestHandler):
+    '''
+    Implements enough of the memcached text protocol to test with.
+    '''
+
+    def handle(self):
+        data = self.server.data
+        for line in iter(self.rfile.readline, ''):
+            parts = line.split()
+            if parts[0] == 'get':
+                item = data.get(parts[1])
+                if item is not None and item[1] and item[1] <= time.time():
+                    item = data.pop(parts[1])
+                if item is not None:
+                    self.wfile.write('VALUE %s 0 %d\r\n%s\r\n' % (
+                        parts[1], len(item[0]), item[0]
+                    ))
+                self.wfile.write('END\r\n')
+            elif parts[0] == 'set':
+                value = self.rfile.read(int(parts[4]) + 2)[:-2]
+                exptime = int(parts[3])
+                data[parts[1]] = (value, exptime and time.time() + exptime)
+                self.wfile.write('STORED\r\n')
+            elif parts[0] == 'delete':
+                found = data.pop(parts[1], None) is not None
+                self.wfile.write(found and 'DELETED\r\n' or 'NOT_FOUND\r\n')
+            elif parts[0] == 'flush_all':
+                data.clear()
+                self.wfile.write('OK\r\n')
+
+
+class TestMemcachedBackend(BackendTests, TestCase):
+
+    def setUp(self):
+        self.server = ThreadingTCPServer(('127.0.0.1', 0), MemcachedHandler)
+        self.server.daemon_threads = True
+        self.server.data = {}
+        thread = threading.Thread(
+            target=self.server.serve_forever,
+            args=(0.01,)
+        )
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def backend(self):
+        return MemcachedBackend('127.0.0.1:%d' % self.server.server_address[1])
+
+    def test_ttl(self):
+        # memcached only supports lifetimes in whole seconds
+        backend = self.backend()
+        backend.set('key', 'value', ttl=0.05)
+        assert self.server.data.values()[0][1] > time.time() + 0.5
+
+    def test_keys_are_hashed_and_prefixed(self):
+        backend = self.backend()
+        backend.prefix = 'app:'
+        backend.set('a key with spaces ' * 20, 'value')
+        key, = self.server.data.keys()
+        assert key.startswith('app:')
+        assert ' ' not in key and len(key) < 250
+
+    def test_multiple_servers(self):
+        port = self.server.server_address[1]
+        backend = MemcachedBackend(['127.0.0.1:%d' % port] * 2)
+        backend.set('key', 'value')
+        assert backend.get('key') == 'value'
+
+    def test_unavailable_server(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+
+        backend = MemcachedBackend('127.0.0.1:%d' % port, timeout=0.1)
+        backend.set('key', 'value')
+        assert backend.get('key') is None
+        assert backend.get('key', 'default') == 'default'
+        backend.delete('key')
+        backend.clear()
@@ -1,15 +1,20 @@
+import os
+import sys
 import unittest
 
 
 class TestCommandManager(unittest.TestCase):
 
     def test_commands(self):
-        from pecan.commands import ServeCommand, ShellCommand, CreateCommand
+        from pecan.commands import (
+            ServeCommand, ShellCommand, CreateCommand, WarmCommand
+        )
         from pecan.commands.base import CommandManager
         m = CommandManager()
         assert m.commands['serve'] == ServeCommand
         assert m.commands['shell'] == ShellCommand
         assert m.commands['create'] == CreateCommand
+        assert m.commands['warm'] == WarmCommand
 
 
 class TestCommandRunner(unittest.TestCase):
@@ -54,3 +59,110 @@ class TestCreateCommand(unittest.TestCase):
         c = CreateCommand()
         c.manager = FakeManager()
         c.run(FakeArg())
+
+
+class TestWarmCommand(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.root = tempfile.mkdtemp()
+        self.templates = os.path.join(self.root, 'templates')
+        os.makedirs(os.path.join(self.templates, 'sub'))
+        for name, source in (
+            ('index.html', 'Hello, ${name}!'),
+            ('sub/page.html', '<%inherit file="/index.html"/>'),
+        ):
+            with open(os.path.join(self.templates, name), 'w') as f:
+                f.write(source)
+
+        # an application with a custom renderer, which warms templates by
+        # recording them with its extra template variables
+        os.makedirs(os.path.join(self.root, 'warmapp'))
+        open(os.path.join(self.root, 'warmapp', '__init__.py'), 'w').close()
+        with open(os.path.join(self.root, 'warmapp', 'app.py'), 'w') as f:
+            f.write(
+                'from pecan import make_app\n'
+                'loaded = []\n'
+                'class RecordingRenderer(object):\n'
+                '    def __init__(self, path, extra_vars):\n'
+                '        self.extra_vars = extra_vars\n'
+                '    def load_template(self, template):\n'
+                '        ns = self.extra_vars.make_ns({})\n'
+                '        loaded.append((template, ns[\'version\']))\n'
+                'def setup_app(config):\n'
+                '    return make_app(\n'
+                '        object(),\n'
+                '        template_path=config.app.template_path,\n'
+                '        default_renderer=config.app.default_renderer,\n'
+                '        custom_renderers={\'recording\': RecordingRenderer},'
+                '\n'
+                '        extra_template_vars={\'version\': \'1.0\'}\n'
+                '    )\n'
+            )
+        sys.path.insert(0, self.root)
+
+        self.config = os.path.join(self.root, 'config.py')
+        self.write_config()
+
+    def write_config(self, **app):
+        app.setdefault('modules', ['warmapp'])
+        app.setdefault('default_renderer', 'mako')
+        app.setdefault('template_path', self.templates)
+        app.setdefault('template_cache_dir', os.path.join(self.root, 'cache'))
+        with open(self.config, 'w') as f:
+            f.write('app = %r\n' % app)
+
+    def tearDown(self):
+        import shutil
+        from pecan import configuration
+        sys.path.remove(self.root)
+        for module in ('warmapp', 'warmapp.app'):
+            sys.modules.pop(module, None)
+        shutil.rmtree(self.root)
+        configuration.set_config(
+            dict(configuration.initconf()),
+            overwrite=True
+        )
+
+    def run_command(self, *args):
+        from cStringIO import StringIO
+        from pecan.commands import CommandRunner
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            CommandRunner().run(['warm', self.config] + list(args))
+        finally:
+            stdout, sys.stdout = sys.stdout, stdout
+        return stdout.getvalue()
+
+    def test_run(self):
+        output = self.run_command()
+        assert 'index.html' in output
+        assert 'sub/page.html' in output
+        assert 'Compiled 2 of 2 templates with mako' in output
+
+        cached = []
+        for path, dirs, files in os.walk(os.path.join(self.root, 'cache')):
+            cached.extend(f for f in files if f.endswith('.py'))
+        assert len(cached) == 2
+
+    def test_failures(self):
+        with open(os.path.join(self.templates, 'bad.html'), 'w') as f:
+            f.write('<%def name="bad(">')
+        self.assertRaises(SystemExit, self.run_command, '--renderer', 'mako')
+
+    def test_renderer_without_templates(self):
+        self.assertRaises(ValueError, self.run_command, '--renderer', 'json')
+
+    def test_app_renderers(self):
+        self.write_config(default_renderer='recording')
+        output = self.run_command()
+        assert 'Compiled 2 of 2 templates with recording' in output
+
+        from warmapp.app import loaded
+        assert loaded == [('index.html', '1.0'), ('sub/page.html', '1.0')]
+
+    def test_without_cache_dir(self):
+        self.write_config(template_cache_dir=None)
+        output = self.run_command()
+        assert '`template_cache_dir` is not configured' in output
+        assert 'Compiled 2 of 2 templates with mako' in output
@@ -1,8 +1,8 @@
 from cStringIO import StringIO
-from pecan import make_app, expose, redirect, abort
+from pecan import Pecan, make_app, expose, redirect, abort
 from pecan.core import state
 from pecan.hooks import (
-    PecanHook, TransactionHook, HookController, RequestViewerHook
+    PecanHook, TransactionHook, HookController, RequestViewerHook, HookChain
 )
 from pecan.configuration import Config
 from pecan.decorators import transactional, after_commit, after_rollback
@@ -329,6 +329,59 @@ class TestHooks(TestCase):
         assert run_hook[5] == 'after2'
 
 
+class TestHookChain(TestCase):
+
+    def test_phases_skip_noop_methods(self):
+        class BeforeHook(PecanHook):
+            def before(self, state):
+                pass  # pragma: nocover
+
+        class AfterHook(PecanHook):
+            priority = 1
+
+            def after(self, state):
+                pass  # pragma: nocover
+
+        before, after = BeforeHook(), AfterHook()
+        hooks = HookChain([before], [after])
+        assert list(hooks) == [after, before]
+        assert hooks.phases['before'] == [before.before]
+        assert hooks.phases['after'] == [after.after]
+        assert hooks.phases['on_route'] == []
+        assert hooks.phases['on_error'] == []
+
+    def test_chains_are_reused(self):
+        class SimpleHook(PecanHook):
+            pass
+
+        class SubController(HookController):
+            __hooks__ = [SimpleHook()]
+
+            @expose()
+            def index(self):
+                return 'Inside here!'
+
+        class RootController(object):
+            @expose()
+            def index(self):
+                return 'Hello, World!'
+
+            sub = SubController()
+
+        papp = Pecan(RootController(), hooks=[SimpleHook()])
+        app = TestApp(papp)
+        app.get('/')
+        app.get('/sub/')
+        chains = dict(papp.hook_chains)
+        assert len(chains) == 2
+
+        app.get('/')
+        app.get('/sub/')
+        assert len(papp.hook_chains) == 2
+        for key, hooks in papp.hook_chains.items():
+            assert chains[key] is hooks
+
+
 class TestTransactionHook(TestCase):
     def test_transaction_hook(self):
         run_hook = []
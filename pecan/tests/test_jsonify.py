@@ -1,3 +1,4 @@
+import sys
 from datetime import datetime, date
 from decimal import Decimal
 try:
@@ -9,10 +10,17 @@ try:
     from sqlalchemy.engine import create_engine
 except ImportError:
     create_engine = None  # noqa
-from unittest import TestCase
-
-from pecan.jsonify import jsonify, encode, ResultProxy, RowProxy
+if sys.version_info < (2, 7):
+    import unittest2 as unittest  # pragma: nocover
+else:
+    import unittest  # pragma: nocover
+
+from pecan.jsonify import (
+    jsonify, encode, iterencode, register_saobject, register_serializer,
+    ResultProxy, RowProxy
+)
 from pecan import Pecan, expose
+from pecan.jsonify import numpy
 from webtest import TestApp
 
 from webob.multidict       import MultiDict
@@ -49,7 +57,7 @@ def test_simple_rule():
     assert len(result) == 1
 
 
-class TestJsonify(TestCase):
+class TestJsonify(unittest.TestCase):
 
     def test_simple_jsonify(self):
         Person = make_person()
@@ -75,7 +83,31 @@ class TestJsonify(TestCase):
         assert loads(r.body) == {'name': 'Jonathan LaCour'}
 
 
-class TestJsonifyGenericEncoder(TestCase):
+class TestRegisterSerializer(unittest.TestCase):
+
+    def test_register_serializer(self):
+        Person = make_person()
+
+        class Employee(Person):
+            pass
+
+        register_serializer(Person, lambda p: dict(name=p.name))
+
+        people = [Person('Jonathan', 'LaCour'), Employee('Ryan', 'Petrello')]
+        assert loads(encode(people)) == [
+            {'name': 'Jonathan LaCour'}, {'name': 'Ryan Petrello'}
+        ]
+        assert loads(''.join(iterencode(people))) == loads(encode(people))
+
+    def test_register_serializer_twice(self):
+        Person = make_person()
+        register_serializer(Person, lambda p: p.name)
+        self.assertRaises(
+            TypeError, register_serializer, Person, lambda p: p.first_name
+        )
+
+
+class TestJsonifyGenericEncoder(unittest.TestCase):
     def test_json_callable(self):
         class JsonCallable(object):
             def __init__(self, arg):
@@ -116,9 +148,98 @@ class TestJsonifyGenericEncoder(TestCase):
             pass
 
         self.assertRaises(TypeError, encode, Foo())
+        # the result of resolving the class is cached
+        self.assertRaises(TypeError, encode, Foo())
+
+    def test_converter_is_cached_per_class(self):
+        from pecan.jsonify import _converters
+
+        class JsonCallable(object):
+            def __init__(self, arg):
+                self.arg = arg
+
+            def __json__(self):
+                return self.arg
+
+        assert JsonCallable not in _converters
+        assert loads(encode([JsonCallable(1), JsonCallable(2)])) == [1, 2]
+        assert JsonCallable in _converters
+
+    def test_iterencode(self):
+        data = dict(
+            rows=[dict(id=i, when=date(2012, 1, 1)) for i in range(100)]
+        )
+        chunks = list(iterencode(data, chunk_size=64))
+        assert len(chunks) > 1
+        assert all(len(c) >= 64 for c in chunks[:-1])
+        assert loads(''.join(chunks)) == loads(encode(data))
+
+        data = {1: 'int', None: 'null', True: [1.5, (u'\u2713',)]}
+        assert ''.join(iterencode(data)) == encode(data)
+
 
+class TestStreamedJsonify(unittest.TestCase):
 
-class TestJsonifySQLAlchemyGenericEncoder(TestCase):
+    def test_streamed_json_template(self):
+        rows = [dict(id=i, name='Row %d' % i) for i in range(1000)]
+
+        class RootController(object):
+            @expose('json', stream=True)
+            def index(self):
+                return dict(rows=rows)
+
+        app = TestApp(Pecan(RootController()))
+        r = app.get('/')
+        assert r.status_int == 200
+        assert r.content_type == 'application/json'
+        assert loads(r.body) == dict(rows=rows)
+        assert r.body == encode(dict(rows=rows))
+
+    def test_streamed_matches_encode(self):
+        from collections import namedtuple, OrderedDict
+        Point = namedtuple('Point', ['x', 'y'])
+        values = [
+            Decimal('1.10'),
+            Point(1, 2),
+            OrderedDict([('b', 1), ('a', 2)]),
+            dict(price=Decimal('9.99'), point=Point(3, 4)),
+            [date(2012, 1, 1), (Decimal('0.5'), Point(5, 6))],
+            MultiDict(a=1)
+        ]
+        for value in values:
+            assert ''.join(iterencode(value, chunk_size=4)) == encode(value)
+
+
+class TestJsonifyNumPy(unittest.TestCase):
+
+    def setUp(self):
+        if numpy is None:
+            self.skipTest('NumPy not installed')
+
+    def test_array(self):
+        array = numpy.arange(6, dtype='int32').reshape(2, 3)
+        assert loads(encode(array)) == [[0, 1, 2], [3, 4, 5]]
+        assert loads(encode(numpy.array([0.5, 1.5]))) == [0.5, 1.5]
+
+    def test_scalars(self):
+        values = [numpy.int32(1), numpy.float32(0.5), numpy.bool_(True)]
+        assert loads(encode(values)) == [1, 0.5, True]
+
+    def test_structured_array(self):
+        array = numpy.array(
+            [(1, 2.5, 'a'), (2, 3.5, 'b')],
+            dtype=[('id', 'i4'), ('value', 'f8'), ('name', 'S1')]
+        )
+        expected = {'id': [1, 2], 'value': [2.5, 3.5], 'name': ['a', 'b']}
+        assert loads(encode(array)) == expected
+        assert loads(encode(array.view(numpy.recarray))) == expected
+
+    def test_streamed_array(self):
+        data = dict(values=numpy.arange(1000))
+        assert loads(''.join(iterencode(data))) == {'values': range(1000)}
+
+
+class TestJsonifySQLAlchemyGenericEncoder(unittest.TestCase):
 
     def setUp(self):
         if not create_engine:
@@ -146,6 +267,10 @@ class TestJsonifySQLAlchemyGenericEncoder(TestCase):
             def __iter__(self):
                 return iter(self.rows)
 
+            def fetchmany(self, size):
+                rows, self.rows = self.rows[:size], self.rows[size:]
+                return rows
+
             def append(self, row):
                 self.rows.append(row)
 
@@ -188,14 +313,19 @@ class TestJsonifySQLAlchemyGenericEncoder(TestCase):
             schema.Column('last_name', types.Unicode(25)))
 
         class User(object):
-            pass
+            @property
+            def name(self):
+                return '%s %s' % (self.first_name, self.last_name)
         orm.mapper(User, user_table)
+        self.User = User
 
         # create the session
         engine = create_engine('sqlite:///:memory:')
         metadata.bind = engine
         metadata.create_all()
-        session = orm.sessionmaker(bind=engine)()
+        self.engine = engine
+        self.Session = orm.sessionmaker(bind=engine)
+        session = self.Session()
 
         # add some dummy data
         user_table.insert().execute([
@@ -215,6 +345,44 @@ class TestJsonifySQLAlchemyGenericEncoder(TestCase):
             'id': 1, 'first_name': 'Jonathan', 'last_name': 'LaCour'
         }
 
+    @unittest.skipIf(create_engine is None, 'SQLAlchemy not installed')
+    def test_detached_sa_object(self):
+        session = self.Session()
+        user = session.query(self.User).first()
+        session.commit()
+        session.close()
+        assert loads(encode(user)) == {}
+
+    @unittest.skipIf(create_engine is None, 'SQLAlchemy not installed')
+    def test_deferred_columns_are_not_loaded(self):
+        from sqlalchemy import event
+
+        session = self.Session()
+        user = session.query(self.User).options(
+            orm.defer('last_name')
+        ).first()
+
+        statements = []
+        event.listen(
+            self.engine,
+            'before_cursor_execute',
+            lambda *args: statements.append(args[2])
+        )
+        assert loads(encode(user)) == {'id': 1, 'first_name': 'Jonathan'}
+        assert statements == []
+
+    @unittest.skipIf(create_engine is None, 'SQLAlchemy not installed')
+    def test_register_saobject_exclude(self):
+        register_saobject(self.User, exclude=['id', 'last_name'])
+        result = encode(self.sa_object)
+        assert loads(result) == {'first_name': 'Jonathan'}
+
+    @unittest.skipIf(create_engine is None, 'SQLAlchemy not installed')
+    def test_register_saobject_include(self):
+        register_saobject(self.User, include=['id', 'name'])
+        result = encode(self.sa_object)
+        assert loads(result) == {'id': 1, 'name': 'Jonathan LaCour'}
+
     def test_result_proxy(self):
         result = encode(self.result_proxy)
         assert loads(result) == {'count': 2, 'rows': [
@@ -222,6 +390,17 @@ class TestJsonifySQLAlchemyGenericEncoder(TestCase):
             {'id': 2, 'first_name': 'Yoann', 'last_name': 'Roman'}
         ]}
 
+    def test_streamed_result_proxy(self):
+        result = ''.join(iterencode(
+            dict(users=self.result_proxy),
+            chunk_size=16,
+            batch_size=1
+        ))
+        assert loads(result) == {'users': {'count': 2, 'rows': [
+            {'id': 1, 'first_name': 'Jonathan', 'last_name': 'LaCour'},
+            {'id': 2, 'first_name': 'Yoann', 'last_name': 'Roman'}
+        ]}}
+
     def test_row_proxy(self):
         result = encode(self.row_proxy)
         assert loads(result) == {
@@ -0,0 +1,194 @@
+from datetime import date
+from decimal import Decimal
+from unittest import TestCase
+
+from webtest import TestApp
+
+from pecan import Pecan, expose
+from pecan.jsonify import jsonify, numpy
+from pecan.msgpackify import encode, decode
+
+
+class TestMsgPackEncoding(TestCase):
+
+    def test_scalars(self):
+        for value in (None, True, False, 1.5, -2.25, u'', u'\u2713'):
+            assert decode(encode(value)) == value
+
+    def test_integers(self):
+        for value in (
+            0, 1, 127, 128, 255, 256, 65535, 65536, 2 ** 32 - 1, 2 ** 32,
+            2 ** 64 - 1, -1, -32, -33, -128, -129, -32768, -32769,
+            -2 ** 31, -2 ** 31 - 1, -2 ** 63
+        ):
+            assert decode(encode(value)) == value
+        self.assertRaises(OverflowError, encode, 2 ** 64)
+        self.assertRaises(OverflowError, encode, -2 ** 63 - 1)
+
+    def test_known_encodings(self):
+        assert encode(None) == '\xc0'
+        assert encode(5) == '\x05'
+        assert encode(-1) == '\xff'
+        assert encode(200) == '\xcc\xc8'
+        assert encode('abc') == '\xa3abc'
+        assert encode([1, 2]) == '\x92\x01\x02'
+        assert encode({'a': 1}) == '\x81\xa1a\x01'
+        assert encode(bytearray('\x00\x01')) == '\xc4\x02\x00\x01'
+
+    def test_sizes(self):
+        for n in (0, 15, 16, 31, 32, 255, 256, 65535, 65536):
+            s = u'x' * n
+            assert decode(encode(s)) == s
+            items = range(n)
+            assert decode(encode(items)) == items
+            mapping = dict((str(i), i) for i in range(n))
+            assert decode(encode(mapping)) == mapping
+            data = bytearray('\x01' * n)
+            assert decode(encode(data)) == str(data)
+
+    def test_nested(self):
+        value = {'rows': [{'id': 1, 'tags': ('a', 'b')}], 'count': 1}
+        assert decode(encode(value)) == {
+            'rows': [{'id': 1, 'tags': ['a', 'b']}], 'count': 1
+        }
+
+    def test_jsonify_conversions(self):
+        class Person(object):
+            def __init__(self, name):
+                self.name = name
+
+        @jsonify.when_type(Person)
+        def jsonify_person(obj):
+            return dict(name=obj.name)
+
+        class JsonCallable(object):
+            def __json__(self):
+                return [1, 2]
+
+        today = date.today()
+        value = [Person('Jonathan'), JsonCallable(), today, Decimal('1.5')]
+        assert decode(encode(value)) == [
+            {'name': 'Jonathan'}, [1, 2], str(today), 1.5
+        ]
+
+    def test_unsupported(self):
+        class Foo(object):
+            pass
+
+        self.assertRaises(TypeError, encode, Foo())
+
+    def test_decode_extra_data(self):
+        self.assertRaises(ValueError, decode, '\x01\x02')
+
+
+class TestMsgPackNumPy(TestCase):
+
+    def setUp(self):
+        if numpy is None:
+            self.skipTest('NumPy not installed')
+
+    def test_array(self):
+        array = numpy.arange(12, dtype='<f8').reshape(3, 4)
+        encoded = encode(array)
+        assert array.tostring() in encoded
+
+        decoded = decode(encoded)
+        assert decoded.dtype == array.dtype
+        assert decoded.shape == (3, 4)
+        assert (decoded == array).all()
+
+    def test_dicts_like_arrays_are_not_converted(self):
+        value = {'nd': True, 'type': '<f8', 'kind': '', 'shape': [1],
+                 'data': bytearray(8)}
+        decoded = decode(encode(value))
+        assert isinstance(decoded, dict)
+        assert decoded['nd'] is True
+        assert decoded['data'] == '\x00' * 8
+
+    def test_non_contiguous_array(self):
+        array = numpy.arange(12, dtype='int16').reshape(3, 4)[:, 1]
+        assert (decode(encode(array)) == array).all()
+
+    def test_structured_array(self):
+        array = numpy.array(
+            [(1, 2.5), (2, 3.5)], dtype=[('id', 'i4'), ('value', 'f8')]
+        )
+        decoded = decode(encode(array))
+        assert sorted(decoded.keys()) == ['id', 'value']
+        assert decoded['id'].tolist() == [1, 2]
+        assert decoded['value'].tolist() == [2.5, 3.5]
+
+    def test_streamed_array_data_is_not_copied(self):
+        array = numpy.arange(100000, dtype='int64')
+
+        class RootController(object):
+            @expose('msgpack', stream=True)
+            def index(self):
+                return dict(values=array)
+
+        from webob import Request
+        app = Pecan(RootController())
+        status, headers, app_iter = Request.blank('/').call_application(
+            app
+        )
+        chunks = list(app_iter)
+        assert array.tostring() in chunks
+        assert (decode(''.join(chunks))['values'] == array).all()
+
+
+class TestMsgPackRenderer(TestCase):
+
+    @property
+    def app_(self):
+        class RootController(object):
+            @expose('msgpack')
+            def index(self):
+                return dict(name=u'Jonathan', age=30)
+
+            @expose('json')
+            @expose('msgpack')
+            def both(self):
+                return dict(name=u'Jonathan')
+
+        return TestApp(Pecan(RootController()))
+
+    def test_msgpack_template(self):
+        r = self.app_.get('/')
+        assert r.status_int == 200
+        assert r.content_type == 'application/x-msgpack'
+        assert decode(r.body) == {'name': 'Jonathan', 'age': 30}
+
+    def test_msgpack_extension(self):
+        r = self.app_.get('/both.msgpack')
+        assert r.content_type == 'application/x-msgpack'
+        assert decode(r.body) == {'name': 'Jonathan'}
+
+        r = self.app_.get('/both.json')
+        assert r.content_type == 'application/json'
+
+    def test_accept_negotiation(self):
+        for accept in (
+            'application/x-msgpack',
+            'application/msgpack',
+            'application/json;q=0.5, application/x-msgpack'
+        ):
+            r = self.app_.get('/both', headers={'Accept': accept})
+            assert r.content_type == 'application/x-msgpack'
+            assert decode(r.body) == {'name': 'Jonathan'}
+            assert 'Accept' in r.headers['Vary']
+
+    def test_accept_negotiation_respects_quality(self):
+        for accept in (
+            'application/json, application/x-msgpack;q=0.1',
+            'application/json, application/x-msgpack',
+            'application/x-msgpack;q=0.5, */*'
+        ):
+            r = self.app_.get('/both', headers={'Accept': accept})
+            assert r.content_type == 'application/json'
+            assert 'Accept' in r.headers['Vary']
+
+    def test_no_negotiation_without_explicit_accept(self):
+        for accept in (None, '*/*', 'application/*', 'application/json'):
+            headers = accept and {'Accept': accept} or {}
+            r = self.app_.get('/both', headers=headers)
+            assert r.content_type == 'application/json'
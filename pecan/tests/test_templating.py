@@ -1,11 +1,25 @@
-from unittest import TestCase
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest  # pragma: nocover
+else:
+    import unittest  # pragma: nocover
 
-from pecan.templating import RendererFactory, format_line_context
+from webtest import TestApp
 
+from pecan import Pecan, expose
+from pecan.cache import FileBackend
+from pecan.jsonify import ResultProxy
+from pecan.templating import (
+    RendererFactory, format_line_context, NdjsonRenderer, CSVRenderer,
+    FragmentCache, _builtin_renderers
+)
+
+import os
+import shutil
 import tempfile
 
 
-class TestTemplate(TestCase):
+class TestTemplate(unittest.TestCase):
     def setUp(self):
         self.rf = RendererFactory()
 
@@ -31,7 +45,7 @@ class TestTemplate(TestCase):
         self.assertEqual(extra_vars.make_ns({'foo': 2}), {'foo': 2})
 
 
-class TestTemplateLineFormat(TestCase):
+class TestTemplateLineFormat(unittest.TestCase):
 
     def setUp(self):
         self.f = tempfile.NamedTemporaryFile()
@@ -45,3 +59,434 @@ class TestTemplateLineFormat(TestCase):
         self.f.flush()
 
         assert format_line_context(self.f.name, 0).count('Testing Line') == 10
+
+
+class FakeResultProxy(ResultProxy):
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.fetches = 0
+
+    def fetchmany(self, size):
+        self.fetches += 1
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class TestRecordRenderers(unittest.TestCase):
+
+    def test_ndjson(self):
+        renderer = NdjsonRenderer('/', None)
+        records = (dict(id=i) for i in range(3))
+        assert renderer.render(None, records) == \
+            '{"id": 0}\n{"id": 1}\n{"id": 2}\n'
+
+    def test_ndjson_result_proxy(self):
+        renderer = NdjsonRenderer('/', None)
+        renderer.batch_size = 2
+        result = FakeResultProxy([[1], [2], [3]])
+        assert renderer.render(None, result) == '[1]\n[2]\n[3]\n'
+        assert result.fetches == 3
+
+    def test_ndjson_chunks(self):
+        renderer = NdjsonRenderer('/', None)
+        renderer.chunk_size = 20
+        chunks = list(renderer.stream(None, [dict(id=i) for i in range(5)]))
+        assert chunks == [
+            '{"id": 0}\n{"id": 1}\n',
+            '{"id": 2}\n{"id": 3}\n',
+            '{"id": 4}\n'
+        ]
+
+    def test_csv_sequences(self):
+        renderer = CSVRenderer('/', None)
+        rows = [(1, u'caf\xe9', None), [2, 'a,b', 1.5]]
+        assert renderer.render(None, rows) == \
+            '1,caf\xc3\xa9,\r\n2,"a,b",1.5\r\n'
+
+    def test_csv_mappings(self):
+        class JsonCallable(object):
+            def __json__(self):
+                return dict(id=3, name='Three')
+
+        renderer = CSVRenderer('/', None)
+        first = dict(id=1, name='One')
+        fields = first.keys()
+        rows = [first, dict(id=2), JsonCallable()]
+        lines = renderer.render(None, rows).split('\r\n')
+        expected = [first, dict(id=2, name=''), dict(id=3, name='Three')]
+        assert lines[0] == ','.join(fields)
+        assert lines[1:4] == [
+            ','.join(str(row[f]) for f in fields) for row in expected
+        ]
+        assert lines[4:] == ['']
+
+    def test_csv_result_proxy(self):
+        renderer = CSVRenderer('/', None)
+        result = FakeResultProxy([(1, 'One'), (2, 'Two')])
+        assert renderer.render(None, result) == '1,One\r\n2,Two\r\n'
+
+
+class TestRecordRendererStreaming(unittest.TestCase):
+
+    def test_streamed_exports(self):
+        def records():
+            for i in range(3):
+                yield dict(id=i)
+
+        class RootController(object):
+            @expose('ndjson')
+            def ndjson(self):
+                return records()
+
+            @expose('csv')
+            def csv(self):
+                return [(i, 'Row %d' % i) for i in range(3)]
+
+        app = TestApp(Pecan(RootController()))
+
+        r = app.get('/ndjson')
+        assert r.status_int == 200
+        assert r.content_type == 'application/x-ndjson'
+        assert r.body == '{"id": 0}\n{"id": 1}\n{"id": 2}\n'
+
+        r = app.get('/csv')
+        assert r.status_int == 200
+        assert r.content_type == 'text/csv'
+        assert r.body == '0,Row 0\r\n1,Row 1\r\n2,Row 2\r\n'
+
+    def test_exports_are_streamed(self):
+        from webob import Request
+
+        class RootController(object):
+            @expose('csv')
+            def index(self):
+                return [(1, 'One')]
+
+        app = Pecan(RootController())
+        status, headers, app_iter = Request.blank('/').call_application(app)
+        assert 'Content-Length' not in dict(headers)
+        assert ''.join(app_iter) == '1,One\r\n'
+
+
+class TestRendererOptions(unittest.TestCase):
+
+    def tearDown(self):
+        from pecan import configuration
+        configuration.set_config(
+            dict(configuration.initconf()),
+            overwrite=True
+        )
+
+    def test_defaults(self):
+        rf = RendererFactory()
+        assert rf.get('mako', '/').loader.filesystem_checks is True
+
+    def test_production_options(self):
+        rf = RendererFactory(auto_reload=False, cache_size=10)
+        renderers = rf._renderer_classes
+
+        if 'mako' in renderers:
+            loader = rf.get('mako', '/').loader
+            assert loader.filesystem_checks is False
+            assert loader.collection_size == 10
+        if 'jinja' in renderers:
+            env = rf.get('jinja', '/').env
+            assert env.auto_reload is False
+            assert env.cache.capacity == 10
+        if 'genshi' in renderers:
+            loader = rf.get('genshi', '/').loader
+            assert loader.auto_reload is False
+            assert loader._cache.capacity == 10
+        if 'kajiki' in renderers:
+            assert rf.get('kajiki', '/').loader._reload is False
+
+    def test_custom_renderers_are_not_passed_options(self):
+        class CustomRenderer(object):
+            def __init__(self, path, extra_vars):
+                pass
+
+        rf = RendererFactory(
+            custom_renderers=dict(custom=CustomRenderer, mako=CustomRenderer),
+            auto_reload=False
+        )
+        assert isinstance(rf.get('custom', '/'), CustomRenderer)
+        assert isinstance(rf.get('mako', '/'), CustomRenderer)
+        assert rf.get('json', '/') is not None
+
+    def test_options_from_app_config(self):
+        from pecan import configuration, make_app
+
+        configuration.set_config({'app': {
+            'template_auto_reload': False,
+            'template_cache_size': 10
+        }})
+
+        class RootController(object):
+            pass
+
+        app = make_app(RootController()).application
+        assert app.renderers.template_options == dict(
+            auto_reload=False,
+            cache_size=10,
+            cache_dir=None
+        )
+
+        app = make_app(
+            RootController(),
+            template_auto_reload=True
+        ).application
+        assert app.renderers.template_options['auto_reload'] is True
+
+
+class TestCompiledTemplateCache(unittest.TestCase):
+
+    template_path = os.path.join(os.path.dirname(__file__), 'templates')
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def cached_files(self, engine):
+        found = []
+        for path, dirs, files in os.walk(self.cache_dir):
+            relative = os.path.relpath(path, self.cache_dir)
+            if relative.startswith(engine + '-'):
+                found.extend(files)
+        return found
+
+    def render(self, name, template, template_path=None):
+        rf = RendererFactory(cache_dir=self.cache_dir)
+        renderer = rf.get(name, template_path or self.template_path)
+        return renderer.render(template, dict(name='Jonathan'))
+
+    @unittest.skipIf('mako' not in _builtin_renderers, 'Mako not installed')
+    def test_mako_modules_are_cached(self):
+        result = self.render('mako', 'mako.html')
+        assert 'Jonathan' in result
+        assert any(f.endswith('.py') for f in self.cached_files('mako'))
+
+        # a new renderer (e.g., in another process) renders from the cache
+        assert self.render('mako', 'mako.html') == result
+
+    @unittest.skipIf('mako' not in _builtin_renderers, 'Mako not installed')
+    def test_mako_modules_are_cached_per_template_path(self):
+        paths = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+        for i, path in enumerate(paths):
+            self.addCleanup(shutil.rmtree, path)
+            with open(os.path.join(path, 'index.html'), 'w') as f:
+                f.write('%d: ${name}' % i)
+
+        # templates with the same name in different template paths don't
+        # share their compiled modules
+        for i, path in enumerate(paths):
+            assert self.render('mako', 'index.html', path) == (
+                '%d: Jonathan' % i
+            )
+        for i, path in enumerate(paths):
+            assert self.render('mako', 'index.html', path) == (
+                '%d: Jonathan' % i
+            )
+
+    @unittest.skipIf('jinja' not in _builtin_renderers, 'Jinja not installed')
+    def test_jinja_bytecode_is_cached(self):
+        result = self.render('jinja', 'jinja.html')
+        assert 'Jonathan' in result
+        assert self.cached_files('jinja')
+        assert self.render('jinja', 'jinja.html') == result
+
+    def test_cache_is_versioned_per_engine(self):
+        from pecan.templating import _engine_cache_dir
+        path = _engine_cache_dir(self.cache_dir, 'engine', '1.0')
+        assert path == os.path.join(self.cache_dir, 'engine-1.0')
+        assert os.path.isdir(path)
+
+        # creating it again is fine (e.g., from another worker)
+        assert _engine_cache_dir(self.cache_dir, 'engine', '1.0') == path
+
+    def test_cache_is_separated_per_template_path(self):
+        from pecan.templating import _engine_cache_dir
+        first = _engine_cache_dir(self.cache_dir, 'engine', '1.0', '/a')
+        second = _engine_cache_dir(self.cache_dir, 'engine', '1.0', '/b')
+        assert first != second
+        assert os.path.dirname(first) == os.path.dirname(second) == (
+            os.path.join(self.cache_dir, 'engine-1.0')
+        )
+        assert os.path.isdir(first) and os.path.isdir(second)
+
+
+class TestPreloadTemplates(unittest.TestCase):
+
+    template_path = os.path.join(os.path.dirname(__file__), 'templates')
+
+    def tearDown(self):
+        from pecan import configuration
+        configuration.set_config(
+            dict(configuration.initconf()),
+            overwrite=True
+        )
+
+    def test_load_templates(self):
+        rf = RendererFactory()
+        results = dict(
+            (template, error)
+            for template, seconds, error
+            in rf.load_templates('mako', self.template_path)
+        )
+        assert results['mako.html'] is None
+        assert results['mako_bad.html'] is not None
+        assert '__init__.py' in results
+
+        loader = rf.get('mako', self.template_path).loader
+        assert 'mako.html' in loader._collection
+
+    def test_load_templates_requires_template_renderer(self):
+        rf = RendererFactory()
+        self.assertRaises(
+            ValueError,
+            list,
+            rf.load_templates('json', self.template_path)
+        )
+
+    def test_preload_templates(self):
+        import warnings
+        from pecan import Pecan
+
+        class RootController(object):
+            pass
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            app = Pecan(
+                RootController(),
+                template_path=self.template_path,
+                preload_templates=True
+            )
+        assert len(w) == 1
+        assert 'mako_bad.html' in str(w[0].message)
+
+        loader = app.renderers.get('mako', self.template_path).loader
+        assert 'mako.html' in loader._collection
+
+    def test_preload_templates_from_app_config(self):
+        import warnings
+        from pecan import configuration, make_app
+
+        configuration.set_config({'app': {'preload_templates': True}})
+
+        class RootController(object):
+            pass
+
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            app = make_app(
+                RootController(),
+                template_path=self.template_path
+            ).application
+        loader = app.renderers.get('mako', self.template_path).loader
+        assert 'mako.html' in loader._collection
+
+
+class TestFragmentCache(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def render(self):
+        self.calls.append(True)
+        return u'<b>%d</b>' % len(self.calls)
+
+    def test_cache(self):
+        cache = FragmentCache()
+        assert cache('sidebar', self.render) == u'<b>1</b>'
+        assert cache('sidebar', self.render) == u'<b>1</b>'
+        assert len(self.calls) == 1
+        assert cache.stats == dict(hits=1, misses=1)
+
+    def test_vary(self):
+        cache = FragmentCache()
+        assert cache('sidebar', self.render, vary=[1]) == u'<b>1</b>'
+        assert cache('sidebar', self.render, vary=[2]) == u'<b>2</b>'
+        assert cache('sidebar', self.render, vary=[1]) == u'<b>1</b>'
+        assert cache('footer', self.render, vary=[1]) == u'<b>3</b>'
+        assert cache.stats == dict(hits=1, misses=3)
+
+    def test_ttl(self):
+        import time
+        cache = FragmentCache(ttl=0.05)
+        cache('sidebar', self.render)
+        cache('footer', self.render, ttl=60)
+        time.sleep(0.1)
+        assert cache('sidebar', self.render) == u'<b>3</b>'
+        assert cache('footer', self.render) == u'<b>2</b>'
+
+    def test_invalidate(self):
+        cache = FragmentCache()
+        cache('sidebar', self.render, vary=[1])
+        cache.invalidate('sidebar', vary=[1])
+        assert cache('sidebar', self.render, vary=[1]) == u'<b>2</b>'
+
+    def test_generators_are_not_cached(self):
+        cache = FragmentCache()
+        self.assertRaises(TypeError, cache, 'sidebar', lambda: (i for i in ()))
+
+    def test_templates(self):
+        templates = {
+            'jinja': (
+                '{% macro sidebar() %}<b>{{ count() }}</b>{% endmacro %}'
+                '{{ cache("sidebar", sidebar) }}'
+            ),
+            'mako': (
+                '<%def name="sidebar()"><b>${count()}</b></%def>'
+                '${cache("sidebar", lambda: capture(sidebar))}'
+            ),
+            'genshi': '<div>${cache("sidebar", sidebar)}</div>',
+            'kajiki': (
+                '<div><py:def function="sidebar()"><b>${count()}</b></py:def>'
+                '${cache("sidebar", sidebar)}</div>'
+            )
+        }
+        template_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, template_path)
+        for name, source in templates.items():
+            if name not in _builtin_renderers:
+                continue
+            with open(os.path.join(template_path, name + '.html'), 'w') as f:
+                f.write(source)
+
+            class RootController(object):
+                @expose('%s:%s.html' % (name, name))
+                def index(self):
+                    return dict()
+
+            # the file backend also checks that fragments can be pickled
+            cache = FragmentCache(
+                FileBackend(os.path.join(template_path, 'cache', name))
+            )
+
+            def count():
+                self.calls.append(True)
+                return '<%d>' % len(self.calls)
+
+            def sidebar():
+                # Genshi `py:def` output is evaluated by the calling
+                # template, so it's rendered separately
+                from genshi.core import escape
+                from genshi.input import HTML
+                return HTML(u'<b>%s</b>' % escape(count()))
+
+            app = TestApp(Pecan(
+                RootController(),
+                template_path=template_path,
+                extra_template_vars=dict(
+                    cache=cache, count=count, sidebar=sidebar
+                )
+            ))
+            del self.calls[:]
+            body = app.get('/').body
+            assert '<b>' in body, name
+            assert app.get('/').body == body, name
+            assert len(self.calls) == 1, name
+            assert cache.stats == dict(hits=1, misses=1), name
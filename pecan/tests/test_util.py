@@ -0,0 +1,160 @@
+from inspect import getargspec
+from unittest import TestCase
+
+from webob.exc import HTTPNotFound
+
+from pecan.util import (
+    LRUCache, SingleFlight, buffer_chunks, compile_binder, get_binder
+)
+
+
+class TestArgumentBinder(TestCase):
+
+    def test_positional_and_params(self):
+        def f(self, a, b, c='c'):
+            pass  # pragma: nocover
+        binder = compile_binder(getargspec(f))
+        args, kwargs = binder(lambda: {'b': 'B', 'x': 'X'}, ['A%20'], None)
+        assert args == ['A ', 'B', 'c']
+        assert kwargs == {}
+
+    def test_routing_args_and_im_self(self):
+        def f(self, a, b):
+            pass  # pragma: nocover
+        binder = compile_binder(getargspec(f))
+        args, kwargs = binder(dict, ['b+'], 'SELF', ['a+'])
+        assert args == ['SELF', 'a+', 'b ']
+
+    def test_extra_remainder(self):
+        def f(self, a):
+            pass  # pragma: nocover
+
+        def g(self, a, *args, **kwargs):
+            pass  # pragma: nocover
+        binder = compile_binder(getargspec(f))
+        self.assertRaises(HTTPNotFound, binder, dict, ['a', 'b'], None)
+
+        binder = compile_binder(getargspec(g))
+        args, kwargs = binder(lambda: {'a': 'A', 'x': 'X'}, ['a', 'b'], None)
+        assert args == ['a', 'b']
+        assert kwargs == {'x': 'X'}
+
+    def test_params_are_only_fetched_when_needed(self):
+        def f(self, a):
+            pass  # pragma: nocover
+
+        def fail():
+            raise AssertionError('params should not be fetched')  # nocover
+        binder = compile_binder(getargspec(f))
+        assert binder(fail, ['A'], None) == (['A'], {})
+
+    def test_get_binder_recompiles_replaced_argspec(self):
+        def f(self, a):
+            pass  # pragma: nocover
+
+        def g(self, a, b):
+            pass  # pragma: nocover
+        cfg = {'argspec': getargspec(f)}
+        binder = get_binder(cfg)
+        assert get_binder(cfg) is binder
+
+        cfg['argspec'] = getargspec(g)
+        assert get_binder(cfg) is not binder
+        assert get_binder(cfg)(lambda: {'b': 'B'}, ['A'], None)[0] == ['A', 'B']
+
+
+class TestLRUCache(TestCase):
+
+    def test_get_and_set(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.get('b', 2) == 2
+        assert cache.hits == 1
+        assert cache.misses == 2
+
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert 'c' in cache
+        assert len(cache) == 2
+
+    def test_overwrite(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('a', 2)
+        assert cache.get('a') == 2
+        assert len(cache) == 1
+
+    def test_clear(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.get('a') is None
+
+    def test_disabled(self):
+        cache = LRUCache(0)
+        cache.set('a', 1)
+        assert len(cache) == 0
+
+    def test_ttl(self):
+        cache = LRUCache(2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=-1)
+        assert cache.get('a') == 1
+        assert 'b' not in cache
+        assert cache.get('b') is None
+        assert len(cache) == 1
+
+
+class TestBufferChunks(TestCase):
+
+    def test_small_chunks_are_joined(self):
+        chunks = list(buffer_chunks(iter('abcdefg'), 3))
+        assert chunks == ['abc', 'def', 'g']
+
+    def test_large_chunks_pass_through(self):
+        chunks = list(buffer_chunks(['abcd', 'e', 'fghij'], 2))
+        assert chunks == ['abcd', 'e', 'fghij']
+
+    def test_empty(self):
+        assert list(buffer_chunks([], 10)) == []
+
+
+class TestSingleFlight(TestCase):
+
+    def test_leader_and_followers(self):
+        flights = SingleFlight()
+        flight, leader = flights.join('key')
+        assert leader is True
+        other, leader = flights.join('key')
+        assert other is flight and leader is False
+        assert flights.join('other')[1] is True
+
+        flights.land(flight, 'result')
+        assert flights.wait(other) == 'result'
+        assert len(flights) == 1
+
+        # once landed, the next caller leads a new flight
+        new, leader = flights.join('key')
+        assert new is not flight and leader is True
+
+    def test_failed_leader(self):
+        flights = SingleFlight()
+        flight, leader = flights.join('key')
+        flights.land(flight)
+        assert flights.wait(flight) is None
+        assert len(flights) == 0
+
+    def test_wait_timeout(self):
+        flights = SingleFlight()
+        flight, leader = flights.join('key')
+        assert flights.wait(flight, 0.01) is None
+        assert len(flights) == 1
@@ -1,4 +1,9 @@
 import sys
+import urllib
+from threading import Event, Lock
+from time import time
+
+from webob import exc
 
 
 def iscontroller(obj):
@@ -17,3 +22,285 @@ if sys.version_info >= (2, 6, 5):
 else:
     def encode_if_needed(s):  # noqa
         return s.encode('utf-8')
+
+
+def compile_binder(argspec):
+    '''
+    Compiles a controller's argument specification (as returned by
+    ``inspect.getargspec``) into a function which binds request parameters
+    and the URL remainder to positional and keyword arguments for the
+    controller.
+
+    The returned binder is called as ``binder(params, remainder, im_self,
+    routing_args=None)`` and returns an ``(args, kwargs)`` tuple.
+    ``params`` is a callable which returns the request parameters; it's only
+    called if the controller can accept arguments which aren't filled by
+    the remainder, so that (for instance) request bodies aren't parsed for
+    controllers which don't take any parameters.
+    '''
+    names = tuple(argspec[0][1:])
+    positional = len(names)
+    accepts_varargs = bool(argspec[1])
+    accepts_kwargs = bool(argspec[2])
+    all_names = frozenset(argspec[0])
+
+    # get the default positional arguments
+    if argspec[3]:
+        defaults = dict(zip(argspec[0][-len(argspec[3]):], argspec[3]))
+    else:
+        defaults = {}
+
+    def binder(params, remainder, im_self, routing_args=None):
+        args = [im_self] if im_self is not None else []
+
+        remainder = [
+            urllib.unquote_plus(x)
+            if isinstance(x, basestring) and ('%' in x or '+' in x) else x
+            for x in remainder
+        ]
+
+        # prepend the routing args from nested REST controllers
+        if routing_args:
+            remainder = routing_args + remainder
+
+        # handle positional arguments
+        valid_args = names
+        if valid_args and remainder:
+            args.extend(remainder[:positional])
+            remainder = remainder[positional:]
+            valid_args = valid_args[len(args):]
+
+        # handle wildcard arguments
+        if remainder:
+            if not accepts_varargs:
+                raise exc.HTTPNotFound
+            args.extend(remainder)
+
+        kwargs = {}
+        if not valid_args and not accepts_kwargs:
+            return args, kwargs
+
+        # only pull the parameters when the controller can accept them
+        all_params = params()
+        if accepts_kwargs:
+            all_params = dict(all_params)
+
+        # handle positional GET/POST params
+        for name in valid_args:
+            if name in all_params:
+                args.append(all_params[name])
+            elif name in defaults:
+                args.append(defaults[name])
+            else:
+                break
+
+        # handle wildcard GET/POST params
+        if accepts_kwargs:
+            for name, value in all_params.iteritems():
+                if name not in all_names:
+                    kwargs[encode_if_needed(name)] = value
+
+        return args, kwargs
+
+    binder.argspec = argspec
+    return binder
+
+
+def buffer_chunks(chunks, size):
+    '''
+    Joins the (possibly tiny) strings yielded by ``chunks`` and yields them
+    as chunks of at least ``size`` characters (except for the last chunk).
+    Strings which are at least ``size`` characters long by themselves are
+    yielded as they are, rather than being copied into a larger chunk.
+
+    :param chunks: an iterable of strings
+    :param size: the minimum length of each yielded chunk
+    '''
+    buf = []
+    buffered = 0
+    for chunk in chunks:
+        if len(chunk) >= size:
+            if buf:
+                yield ''.join(buf)
+                buf = []
+                buffered = 0
+            yield chunk
+            continue
+        buf.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield ''.join(buf)
+            buf = []
+            buffered = 0
+    if buf:
+        yield ''.join(buf)
+
+
+def get_binder(cfg):
+    '''
+    Returns the compiled argument binder for a controller, compiling (and
+    storing) a new one if its ``argspec`` was replaced after it was exposed.
+
+    :param cfg: The controller's ``_pecan`` configuration dictionary.
+    '''
+    binder = cfg.get('binder')
+    if binder is None or binder.argspec is not cfg['argspec']:
+        binder = cfg['binder'] = compile_binder(cfg['argspec'])
+    return binder
+
+
+class LRUCache(object):
+    '''
+    A thread-safe, size-bounded mapping which evicts its least recently used
+    entries first, and counts cache hits and misses.
+
+    :param maxsize: The maximum number of entries to keep.
+    :param ttl: An optional default lifetime for entries, in seconds.
+    '''
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._lock = Lock()
+        self.clear()
+
+    def clear(self):
+        '''
+        Removes every entry from the cache.
+        '''
+        with self._lock:
+            self._data = {}
+            # a circular, doubly linked list of [prev, next, key, value,
+            # expires] links, ordered from least to most recently used
+            self._root = root = []
+            root[:] = [root, root, None, None, None]
+
+    def get(self, key, default=None):
+        '''
+        Returns the value for ``key`` (marking it as recently used), or
+        ``default`` if it isn't cached.
+        '''
+        with self._lock:
+            link = self._data.get(key)
+            if link is not None and link[4] is not None and link[4] <= time():
+                self._unlink(link)
+                del self._data[key]
+                link = None
+            if link is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._unlink(link)
+            self._append(link)
+            return link[3]
+
+    def set(self, key, value, ttl=None):
+        '''
+        Stores ``value`` for ``key``, evicting the least recently used entry
+        if the cache is full.
+
+        :param ttl: The lifetime of this entry, in seconds.  Defaults to the
+                    cache's ``ttl``.
+        '''
+        if self.maxsize <= 0:
+            return
+        if ttl is None:
+            ttl = self.ttl
+        expires = time() + ttl if ttl is not None else None
+        with self._lock:
+            link = self._data.get(key)
+            if link is not None:
+                self._unlink(link)
+                link[3], link[4] = value, expires
+            else:
+                if len(self._data) >= self.maxsize:
+                    oldest = self._root[1]
+                    self._unlink(oldest)
+                    del self._data[oldest[2]]
+                link = self._data[key] = [None, None, key, value, expires]
+            self._append(link)
+
+    def delete(self, key):
+        '''
+        Removes the entry for ``key``, if there is one.
+        '''
+        with self._lock:
+            link = self._data.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+
+    def _unlink(self, link):
+        link[0][1] = link[1]
+        link[1][0] = link[0]
+
+    def _append(self, link):
+        last = self._root[0]
+        link[0], link[1] = last, self._root
+        last[1] = self._root[0] = link
+
+    def __contains__(self, key):
+        link = self._data.get(key)
+        return link is not None and (link[4] is None or link[4] > time())
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Flight(object):
+
+    def __init__(self, key):
+        self.key = key
+        self.result = None
+        self.landed = Event()
+
+
+class SingleFlight(object):
+    '''
+    Coordinates concurrent executions of the same work, identified by a
+    key, so that only the first (the "leader") does the work, while the
+    others wait for it to finish and share its result.
+    '''
+
+    def __init__(self):
+        self._lock = Lock()
+        self._flights = {}
+
+    def join(self, key):
+        '''
+        Joins the flight for ``key``, returning a ``(flight, leader)`` tuple.
+        If ``leader`` is ``True``, the caller must do the work and then call
+        ``land``; otherwise, it can ``wait`` for the leader's result.
+        '''
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight(key)
+            return flight, True
+
+    def land(self, flight, result=None):
+        '''
+        Ends ``flight``, sharing ``result`` with the callers waiting for it.
+        Subsequent callers (for the same key) start a new flight.
+        '''
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        flight.result = result
+        flight.landed.set()
+
+    def wait(self, flight, timeout=None):
+        '''
+        Waits for ``flight`` to land, returning the leader's result (which
+        is ``None`` if the leader failed).
+
+        :param timeout: The maximum number of seconds to wait for, after
+                        which ``None`` is returned.  Waits indefinitely by
+                        default.
+        '''
+        flight.landed.wait(timeout)
+        return flight.result
+
+    def __len__(self):
+        return len(self._flights)
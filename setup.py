@@ -98,6 +98,7 @@ setup(
     serve = pecan.commands:ServeCommand
     shell = pecan.commands:ShellCommand
     create = pecan.commands:CreateCommand
+    warm = pecan.commands:WarmCommand
     [pecan.scaffold]
     base = pecan.scaffolds:BaseScaffold
     [console_scripts]